@@ -3,19 +3,36 @@ from docx import Document
 from .semantice_chunker import SemanticChunker
 from llama_index.core.schema import Document as LlamaIndexDocument
 from llama_index.core.schema import TextNode
-from typing import List
+from typing import Callable, Iterator, List
+from itertools import islice
 from .nomic_embed import NomicEmbed
+import numpy as np
 from numpy import ndarray
 import json
 from datetime import datetime
-from utils import binary_array_to_base64, base64_to_binary_array, binary_quantized, float32_vector_to_base64, base64_to_float32_vector
+from utils import binary_array_to_base64, base64_to_binary_array, binary_quantized, float32_vector_to_base64, base64_to_float32_vector, scalar_quantized, int8_vector_to_base64, base64_to_int8_vector
 import copy
+import hashlib
 
 def datetime_to_str(dt: datetime) -> str:
     if dt is None:
         return None
     return dt.strftime('%Y-%m-%d %H:%M:%S')
 
+def document_id(file_path: str, content_hash: str | None = None) -> str:
+    """Id of an uploaded document, from the sha256 of its content.
+    The same file gets the same id in every process, so uploading it again replaces it (see Application.insert_doc).
+    content_hash is the sha256 hex digest if the caller already computed it (e.g. while receiving the upload),
+    otherwise the file is hashed.
+    """
+    if content_hash is None:
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                sha256.update(chunk)
+        content_hash = sha256.hexdigest()
+    return 'user_' + content_hash[:32]
+
 class D2D():
     """Class for converting documents to json form and then save it to disk in base64 format. And load back the base64 as json.
 
@@ -28,7 +45,7 @@ class D2D():
     """
     
     def __init__(self):
-        self.chunker = SemanticChunker()
+        self.chunker = SemanticChunker(embed_chunks=True)
         self.text_embedder = NomicEmbed()
 
     def __chunk_nodes_from_document(self, document: LlamaIndexDocument) -> List[TextNode]:
@@ -37,13 +54,15 @@ class D2D():
         nodes = self.chunker.chunk_nodes_from_documents([document])
         return nodes
 
+    def _chunk_embedding(self, chunk: TextNode) -> ndarray:
+        """Embedding of a chunk, computed by the chunker or, if it has none, by the text embedder"""
+        if chunk.embedding is not None:
+            return np.asarray(chunk.embedding, dtype=np.float32)
+        return self.text_embedder._get_text_embedding(chunk.text)
 
-    def _convert_pdf_to_dict(self, file_path: str) -> dict:
-        """Converts pdf file to dict.
-        """
-        pdf = PdfReader(file_path)
+    def _pdf_metadata(self, pdf: PdfReader, file_path: str) -> dict:
         metadata = pdf.metadata
-        metadata = {
+        return {
             'title': metadata.title,
             'path': file_path,
             'author': metadata.author,
@@ -53,23 +72,97 @@ class D2D():
             'producer': metadata.producer,
             'subject': metadata.subject,
         }
-        text = ''
-        for page in pdf.pages:
-            text += page.extract_text()
+
+    def _iter_pdf_pages(self, pdf: PdfReader, on_page: Callable[[int, int], None] | None = None) -> Iterator[str]:
+        """Text of each page, extracted only when the page is reached. on_page(pages parsed, total pages) follows the progress"""
+        n_pages = len(pdf.pages)
+        for i, page in enumerate(pdf.pages, start=1):
+            text = page.extract_text() or ''
+            if on_page is not None:
+                on_page(i, n_pages)
+            yield text
+
+    def stream_pdf(
+            self,
+            file_path: str,
+            pages_per_window: int = 8,
+            on_page: Callable[[int, int], None] | None = None,
+            content_hash: str | None = None
+        ) -> Iterator[dict]:
+        """Converts a pdf file to dicts of the same form as _convert_pdf_to_dict, a window of pages at a time.
+
+        Pages are extracted lazily and chunked pages_per_window at a time. The last chunk of a window may
+        continue on the next page, so it is carried over and chunked again with the next window, unless it
+        is the only chunk of the window or it is longer than the text of the window's pages. The carry-over
+        is thus at most one window of text, and a chunk that keeps growing across windows is emitted.
+        Breakpoints are computed per window, so chunks can differ slightly from _convert_pdf_to_dict.
+
+        Args:
+            file_path (str): Path of the pdf
+            pages_per_window (int): Number of pages chunked and embedded together
+            on_page (Callable[[int, int], None] | None): Called with (pages parsed, total pages) after each page
+            content_hash (str | None): sha256 of the file if already known, see document_id
+        Returns:
+            Iterator[dict]: One dict per window, 'content' holds only the chunks of that window,
+            numbered after the chunks of the previous windows
+        """
+        pdf = PdfReader(file_path)
+        metadata = self._pdf_metadata(pdf, file_path)
+        id = document_id(file_path, content_hash)
+        pages = self._iter_pdf_pages(pdf, on_page)
+        carry = ''
+        n_chunks = 0
+        while True:
+            window = list(islice(pages, pages_per_window))
+            is_last = len(window) < pages_per_window
+            window_text = ''.join(window)
+            text = carry + window_text
+            chunks = self.__chunk_nodes_from_document(LlamaIndexDocument(text=text)) if text else []
+            carry = ''
+            if not is_last and len(chunks) > 1 and len(chunks[-1].text) <= len(window_text):
+                carry = chunks.pop().text
+            content = {}
+            for chunk in chunks:
+                embedding = self._chunk_embedding(chunk)
+                content[f'{id}_text_{n_chunks}'] = {
+                    'content': chunk.text,
+                    'embedding': binary_quantized(embedding),
+                    'rescore_embedding': scalar_quantized(embedding),
+                }
+                n_chunks += 1
+            yield {
+                'id': id,
+                'metadata': metadata,
+                'content': content,
+                'images': {
+                }
+            }
+            if is_last:
+                return
+
+    def _convert_pdf_to_dict(self, file_path: str, content_hash: str | None = None) -> dict:
+        """Converts pdf file to dict.
+        """
+        pdf = PdfReader(file_path)
+        metadata = self._pdf_metadata(pdf, file_path)
+        text = ''.join(self._iter_pdf_pages(pdf))
         text = self.__chunk_nodes_from_document(LlamaIndexDocument(text=text))
         text_embed: list[ndarray] = []
+        rescore_embed: list[ndarray] = []
         for chunk in text:
-            quantized = binary_quantized(self.text_embedder._get_text_embedding(chunk.text))
-            text_embed.append(quantized)
+            embedding = self._chunk_embedding(chunk)
+            text_embed.append(binary_quantized(embedding))
+            rescore_embed.append(scalar_quantized(embedding))
         
-        id = 'user_' + str(hash(file_path))
+        id = document_id(file_path, content_hash)
         pdf_json = {
             'id': id,
             'metadata': metadata,
             'content': {
                 f'{id}_text_{i}': {
                     'content': text[i].text,
-                    'embedding': text_embed[i]
+                    'embedding': text_embed[i],
+                    'rescore_embedding': rescore_embed[i],
                     }
                 for i in range(len(text))
             },
@@ -78,7 +171,7 @@ class D2D():
         }
         return pdf_json
     
-    def _convert_docx_to_dict(self, file_path: str) -> dict:
+    def _convert_docx_to_dict(self, file_path: str, content_hash: str | None = None) -> dict:
         """Converts docx file to json form.
         """
         doc = Document(file_path)
@@ -102,18 +195,21 @@ class D2D():
 
         text = self.__chunk_nodes_from_document(LlamaIndexDocument(text=text))
         text_embed: list[ndarray] = []
+        rescore_embed: list[ndarray] = []
         for chunk in text:
-            quantized = binary_quantized(self.text_embedder._get_text_embedding(chunk.text))
-            text_embed.append(quantized)
+            embedding = self._chunk_embedding(chunk)
+            text_embed.append(binary_quantized(embedding))
+            rescore_embed.append(scalar_quantized(embedding))
 
-        id = 'user_' + str(hash(file_path))
+        id = document_id(file_path, content_hash)
         doc_json = {
             'id': id,
             'metadata': metadata,
             'content': {
                 f'{id}_text_{i}': {
                     'content': text[i].text,
-                    'embedding': text_embed[i]
+                    'embedding': text_embed[i],
+                    'rescore_embedding': rescore_embed[i],
                     }
                 for i in range(len(text))
             },
@@ -122,13 +218,13 @@ class D2D():
         }
         return doc_json
     
-    def convert_to_dict(self, file_path: str) -> dict | None:
-        """Converts file to json form.
+    def convert_to_dict(self, file_path: str, content_hash: str | None = None) -> dict | None:
+        """Converts file to json form. content_hash is the sha256 of the file if already known, see document_id
         """
         if file_path.endswith('.pdf'):
-            return self._convert_pdf_to_dict(file_path)
+            return self._convert_pdf_to_dict(file_path, content_hash)
         elif file_path.endswith('.docx'):
-            return self._convert_docx_to_dict(file_path)
+            return self._convert_docx_to_dict(file_path, content_hash)
         else:
             print('Error: Unsupported file format.')
             return None
@@ -141,6 +237,8 @@ class D2D():
             emb = dat["content"][id]["embedding"]
             base64 = binary_array_to_base64(emb)
             dat["content"][id]["embedding"] = base64
+            if "rescore_embedding" in dat["content"][id]:
+                dat["content"][id]["rescore_embedding"] = int8_vector_to_base64(dat["content"][id]["rescore_embedding"])
         for id in dat["images"]:
             emb = dat["images"][id]["embedding"]
             base64 = float32_vector_to_base64(emb)
@@ -157,6 +255,8 @@ class D2D():
             base64 = data["content"][id]["embedding"]
             emb = base64_to_binary_array(base64)
             data["content"][id]["embedding"] = emb
+            if "rescore_embedding" in data["content"][id]:
+                data["content"][id]["rescore_embedding"] = base64_to_int8_vector(data["content"][id]["rescore_embedding"])
         for id in data["images"]:
             base64 = data["images"][id]["embedding"]
             emb = base64_to_float32_vector(base64)
@@ -8,4 +8,5 @@ from .utils import *
 from .binary_quantized_rag import *
 from .application import Application
 from .query_session import *
+from .ingestion_jobs import *
 from .api import api
\ No newline at end of file
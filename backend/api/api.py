@@ -2,13 +2,14 @@ import sys
 import os
 import json
 import asyncio
+import hashlib
 import aiofiles
-from fastapi import BackgroundTasks, FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect, UploadFile
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect, UploadFile
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from llama_index.core.schema import Document as LLamaDocument
-from backend import Application, QuerySession, QueryState, Query
+from backend import Application, QuerySession, QueryState, Query, IngestionQueueFull
 
 SYSTEM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(SYSTEM_PATH)
@@ -22,6 +23,24 @@ query_sessions: dict[str, QuerySession] = {}
 # Create 'uploads' directory if it doesn't exist
 os.makedirs("uploads", exist_ok=True)
 
+@api.on_event("shutdown")
+def save_retriever_snapshot():
+    """Persist vectors added during this session, so the next startup can skip the json walk"""
+    if application.retriever.modified:
+        application.retriever.save_snapshot()
+
+@api.on_event("shutdown")
+def save_query_embedding_cache():
+    """Keep popular query embeddings warm across restarts"""
+    application.query_embedding_cache.save()
+
+@api.on_event("shutdown")
+def shutdown_pipeline():
+    application.pipeline.shutdown()
+    application.crawl_scheduler.shutdown()
+    application.indexer.shutdown()
+    application.ingestion_jobs.shutdown()
+
 # Register the API routes here
 # Ping route (for testing)
 @api.get('/api/ping')
@@ -43,26 +62,23 @@ async def get_text(fragment_id: str):
 async def process_query_receiver(websocket: WebSocket, client_id: str):
     while client_id in query_sessions:
         data = await websocket.receive_text()
-        if query_sessions[client_id].state == QueryState.NONE:
+        session = query_sessions[client_id]
+        if not session.busy:
             try:
                 query = json.loads(data, object_hook=lambda d: Query(**d))
             except json.JSONDecodeError as e:
                 print(f"Error decoding JSON: {e}")
                 continue
-            query_sessions[client_id] = QuerySession(QueryState.SEARCHING_LOCAL)
+            session.publish(QueryState.SEARCHING_LOCAL)
             await asyncio.sleep(0) # Allow the consumer to process the query
             await application.process_query(query.query, query_sessions, client_id)
 
 async def process_query_sender(websocket: WebSocket, client_id: str):
+    """Send every state transition of the session, sleeping on its queue while the client is idle"""
+    session = query_sessions[client_id]
     while client_id in query_sessions:
-        state = query_sessions[client_id].state
-        if state in {QueryState.SEARCHING_LOCAL, QueryState.SEARCHING_INTERNET}:
-            await websocket.send_json(query_sessions[client_id].__dict__)
-            query_sessions[client_id].state = QueryState.PENDING
-        elif state in {QueryState.SUCCESS, QueryState.ERROR}:
-            await websocket.send_json(query_sessions[client_id].__dict__)
-            query_sessions[client_id].state = QueryState.NONE
-        await asyncio.sleep(0)
+        update = await session.next_update()
+        await websocket.send_json(update)
 
 @api.websocket('/api/process-query')
 async def process_query(websocket: WebSocket):
@@ -77,6 +93,9 @@ async def process_query(websocket: WebSocket):
         pass
     finally:
         query_sessions.pop(client_id, None)
+        # The sender is blocked on its queue and would never notice the session is gone
+        producer.cancel()
+        consumer.cancel()
             
     
 @api.post('/api/preprocess-query')
@@ -93,17 +112,19 @@ async def preprocess_query(request: Request):
     
     # Process the user query through NaiveRAG
     # answer = naive_rag.process_query(user_query)
-    answer = application.preprocess_query(user_query)
+    answer = await application.apreprocess_query(user_query)
     # return jsonify(answer), 200
     return {"response": answer}
     
+# Size of the pieces an upload is read, hashed and written in
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 @api.post('/api/upload-document')
-async def upload_document(file: UploadFile, background_tasks: BackgroundTasks):
+async def upload_document(file: UploadFile):
     """
     Flask API endpoint to upload a document file.
+    The file is streamed to disk and ingested by a background job, follow it with /api/ingestion-jobs/{job_id}.
     """
-    # Get the file content
-    content = await file.read()
     # Get the file name
     filename = file.filename
     # Safeguard against .git file tampering
@@ -112,12 +133,37 @@ async def upload_document(file: UploadFile, background_tasks: BackgroundTasks):
     # Check if the file is docx or pdf
     if not filename.endswith((".docx", ".pdf")):
         raise HTTPException(status_code=400, detail="Invalid file format")
-    path = os.path.join("uploads", filename)
-    async with aiofiles.open(path, "wb+") as f:
-        await f.write(content)
-    background_tasks.add_task(application.insert_doc, path)
+    path = application.ingestion_jobs.upload_path(filename)
+    content_hash = hashlib.sha256()
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                content_hash.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        # Client disconnected or write error, do not leave the partial file behind
+        application.ingestion_jobs.remove_upload(path)
+        raise
+    try:
+        job = application.ingestion_jobs.submit(filename, path, content_hash.hexdigest())
+    except IngestionQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if job.state == job.DUPLICATE:
+        return {"message": "Document already uploaded", **job.to_dict()}
+    if job.duplicate_of is not None:
+        return {"message": "Document already being ingested", **job.to_dict()}
     # Return a 201 response
-    return {"message": "Document uploaded successfully"}
+    return {"message": "Document uploaded successfully", **job.to_dict()}
+
+@api.get('/api/ingestion-jobs/{job_id}')
+async def get_ingestion_job(job_id: str):
+    """
+    Flask API endpoint to follow the ingestion of an uploaded document.
+    """
+    job = application.ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
     
 # Index route, transfer control to the React frontend
 # full_path is needed, DO NOT REMOVE
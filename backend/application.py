@@ -1,22 +1,32 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import time
+from contextlib import aclosing
 from .binary_quantized_rag.retriever import Retriever
-from .naive_rag import Generator
+from .binary_quantized_rag.document_store import format_metadata, post_id_of
+from .naive_rag import Generator, DeltaRelay
 from .nomic_embed import NomicEmbed
+from .model_registry import model_registry
+from .query_embedding_cache import QueryEmbeddingCache
+from .pipeline import Pipeline
+from .crawl_scheduler import CrawlScheduler, CrawlQueueFull
+from .ingestion_jobs import IngestionJobManager, IngestionJob
+from .semantic_answer_cache import SemanticAnswerCache
+from .context_packer import ContextPacker
 from .utils import *
 from pprint import pprint
 from memory_profiler import profile
 from .query_preprocessor import QueryPreprocessor
 from qdrant_client.conversions.common_types import ScoredPoint
-from typing import List
+from typing import AsyncIterator, Callable, Dict, List, Tuple
 import os
 import json
 from numpy import ndarray
+import numpy as np
 from PIL.ImageFile import ImageFile
 from .D2D import D2D
 from .nomic_embed_vision import NomicEmbedVision
 from .query_session import QuerySession, QueryState
-from database import Indexer
+from database import Indexer, CrawlResult
 
 class Application():
     """
@@ -39,21 +49,54 @@ class Application():
     def __init__(self):
         if not hasattr(self, 'initialized'):  # Ensure __init__ is only called once
             self.retriever = Retriever()
-            self.indexer = Indexer()
+            # Chrome instances scraping CNN posts, shared by the crawl_scheduler.max_workers crawls that run at once
+            self.indexer = Indexer(cnn_scrape_workers=4)
             self.generator = Generator()
             self.text_embed_model = NomicEmbed()
             self.query_preprocessor = QueryPreprocessor()
             self.initialized = True
             self.documents_loader = D2D()
-
-    def _load_doc(self, path: str) -> dict:
+            # Number of texts passed to the LLM, fewer when candidates can be rescored with int8 vectors
+            self.text_top_k = 16
+            self.rescored_text_top_k = 8
+            # Assembled article texts of get_all_text_from_fragment_id, keyed by post id (size in characters)
+            self.article_cache = LRUCache(max_entries=512, max_size=32 * 1024 * 1024, sizeof=len)
+            # Chunk texts indexed so far of the pdfs being streamed, keyed by post id (their json is written at the end)
+            self._ingesting: Dict[str, List[str]] = {}
+            # Query embeddings shared by every search entry point, saved on shutdown
+            self.query_embedding_cache = QueryEmbeddingCache(
+                self.text_embed_model,
+                persist_path=os.path.join('./resources', 'query-embedding-cache.npz'),
+            )
+            # Executor and per-stage concurrency limits of process_query
+            self.pipeline = Pipeline()
+            # Internet searches of every client share one fixed worker budget
+            self.crawl_scheduler = CrawlScheduler(self.search_internet, max_workers=2, max_queued=8)
+            # Uploaded documents, ingested one at a time and skipped when their content was already ingested
+            self.ingestion_jobs = IngestionJobManager(
+                self.insert_doc,
+                max_workers=1,
+                hashes_path=os.path.join('./resources', 'ingested-documents.json'),
+                post_exists=self._post_exists,
+            )
+            # Search all local spaces at once and run both informative checks in parallel (see _search_local_speculative)
+            self.speculative_search = True
+            # Final answers of near-identical queries with the same retrieved texts
+            self.answer_cache = SemanticAnswerCache(max_distance=24, ttl=3600)
+            # Token budget of the documents of every LLM prompt
+            self.context_packer = ContextPacker(max_tokens=3000)
+            # Every component above shares the same embedding weights, loaded on first use
+            model_registry.report()
+
+    def _load_doc(self, path: str, content_hash: str | None = None) -> dict:
         """Load document file (docx, pdf) to ram (dict)
         Args:
             path str: file path
+            content_hash str | None: sha256 of the file if already known
         Returns:
             data dict: data in dict
         """
-        data = self.documents_loader.convert_to_dict(path)
+        data = self.documents_loader.convert_to_dict(path, content_hash)
         if data is None:
             raise ValueError(f"Cannot load data from {path}")
         return data
@@ -66,38 +109,121 @@ class Application():
         """
         self.documents_loader.save_to_disk(path, data)
 
-    def insert_doc(self,path:str)->None:
+    def insert_doc(self,path:str,job:IngestionJob|None=None)->str|None:
         """Save the document in the database path (./resources/quantized-db) 
         and upload the vectors to vector space
 
         Args: 
             - path (str): file path
+            - job (IngestionJob | None): progress of the ingestion, updated as the document is processed
         Returns:
-            - None
+            - str | None: id of the document, None if it cannot be loaded
 
         Guilde
         1. Save the json in database path (retriever.database_path)
         2. For each chunked text, load that id + vector to retriever.text_space
         using self.retriever.add_point_to_text_space(point_id=,vector=)
+
+        The document id is a hash of the content (see D2D.document_id), so inserting the same document again
+        replaces its points instead of adding duplicates.
+        PDFs are ingested with _insert_pdf_streaming, so their first pages are searchable before the whole file is processed.
         """
+        if path.endswith('.pdf'):
+            return self._insert_pdf_streaming(path, job=job)
         try:
-            data = self._load_doc(path)
+            data = self._load_doc(path, job.content_hash if job is not None else None)
         except:
             print(f"ERROR: Cannot load data from {path}")
-            return
+            return None
+        if job is not None:
+            job.post_id = data['id']
+            job.chunks_embedded = len(data['content'])
         self._save_data(os.path.join(self.retriever.database_path, f"{data['id']}.json"), data)
-        for key, value in data['content'].items():
-            point_id = key
-            vector = value['embedding']
-            #vector = base64_to_binary_array(vector)
-            self.retriever.add_point_to_text_space(point_id=point_id,vector=vector)
+        self._invalidate_posts([data['id']])
+        self._remove_post_points(data['id'])
+        self._add_content_points(data['content'])
+        if job is not None:
+            job.points_indexed = len(data['content'])
         os.remove(path)
+        return data['id']
         """Uncomment this if you want to add image vectors to image space and D2D support image (currently not)
-        for key, value in data['images'].items():
-            point_id = key
-            vector = value['embedding']
-            self.retriever.add_point_to_image_space(point_id=point_id,vector=vector)"""
+        if data['images']:
+            point_ids = list(data['images'].keys())
+            vectors = np.stack([value['embedding'] for value in data['images'].values()])
+            image_urls = [value['image_url'] for value in data['images'].values()]
+            self.retriever.add_points_to_image_space(point_ids=point_ids,vectors=vectors,image_urls=image_urls)"""
+
+
+    def _add_content_points(self, content: dict) -> None:
+        """Add the chunks of a document dict ('content' of D2D) to the text space and the text rescore space"""
+        if not content:
+            return
+        point_ids = list(content.keys())
+        vectors = np.stack([value['embedding'] for value in content.values()])
+        texts = [value['content'] for value in content.values()]
+        self.retriever.add_points_to_text_space(point_ids=point_ids,vectors=vectors,texts=texts)
+        rescore_ids = [key for key, value in content.items() if 'rescore_embedding' in value]
+        if rescore_ids:
+            rescore_vectors = np.stack([content[key]['rescore_embedding'] for key in rescore_ids])
+            self.retriever.add_points_to_text_rescore(point_ids=rescore_ids,vectors=rescore_vectors)
+
+    def _post_exists(self, post_id: str) -> bool:
+        """Whether an uploaded document is still indexed: its json exists and its first chunk is in the text space"""
+        json_path = os.path.join(self.retriever.database_path, f"{post_id}.json")
+        return os.path.exists(json_path) and f"{post_id}_text_0" in self.retriever.texts
+
+    def _remove_post_points(self, post_id: str) -> None:
+        """Remove the points of a document indexed before, so indexing it again does not duplicate them"""
+        removed = self.retriever.remove_post(post_id)
+        if removed:
+            print(f"Replacing the {removed} points of {post_id}")
+
+    def _insert_pdf_streaming(self, path: str, pages_per_window: int = 8, job: IngestionJob | None = None) -> str | None:
+        """insert_doc of a pdf, a window of pages at a time (see D2D.stream_pdf).
+        After each window its chunks are added to the text space, so the beginning of a large pdf can be searched
+        while the rest is processed. Its fragments are read from self._ingesting until the json is saved, once,
+        with every chunk at the end (or with the chunks indexed so far if the pdf fails midway).
+        """
+        data = None
+        on_page = job.set_pages if job is not None else None
+        try:
+            content_hash = job.content_hash if job is not None else None
+            for window in self.documents_loader.stream_pdf(path, pages_per_window=pages_per_window, on_page=on_page, content_hash=content_hash):
+                if data is None:
+                    data = {**window, 'content': {}}
+                    if job is not None:
+                        job.post_id = data['id']
+                    self._ingesting[data['id']] = []
+                    self._invalidate_posts([data['id']])
+                    self._remove_post_points(data['id'])
+                elif not window['content']:
+                    continue
+                data['content'].update(window['content'])
+                if job is not None:
+                    job.chunks_embedded = len(data['content'])
+                self._add_content_points(window['content'])
+                self._ingesting[data['id']].extend(value['content'] for value in window['content'].values())
+                if job is not None:
+                    job.points_indexed = len(data['content'])
+                print(f"Indexed {len(data['content'])} chunks of {path}")
+        except Exception as e:
+            print(f"ERROR: Cannot load data from {path}: {e}")
+            if job is not None:
+                job.error = str(e)
+            if data is not None and data['content']:
+                self._save_pdf_data(data)
+            return None
+        self._save_pdf_data(data)
+        os.remove(path)
+        return data['id']
 
+    def _save_pdf_data(self, data: dict) -> None:
+        """Save the json of a streamed pdf and stop serving its fragments from self._ingesting"""
+        try:
+            self._save_data(os.path.join(self.retriever.database_path, f"{data['id']}.json"), data)
+        finally:
+            self._ingesting.pop(data['id'], None)
+            self._invalidate_posts([data['id']])
 
     def begin(self):
         """
@@ -116,20 +242,19 @@ class Application():
                 return           
 
             # get query_embedding and search images space
-            query_embedding = self.text_embed_model._get_embeddings_for_image_query(query)
+            query_embedding = self.query_embedding_cache.get_embedding(query)
             img_urls, image_score_points = self.retriever.search_image_space(query_embedding)
             pprint("This is the list of image urls")
             pprint(img_urls)
             pprint("List of image id which you use to retrieve full document text")
             pprint(image_score_points)
             
+            float_query_embedding = query_embedding
             query_embedding = binary_quantized(query_embedding)
             
             # search text space
-            texts, text_score_points  = self.retriever.search_text_space(query_embedding)
-            document_str = ""
-            for i,text in enumerate(texts):
-                document_str += f"Document {i}:\n{text}\n\n"
+            texts, text_score_points  = self._search_texts(query_embedding, float_query_embedding)
+            document_str = self.context_packer.pack(texts, [point.id for point in text_score_points])
             response = self.generator.check_informative(user_query=query,documents_str=document_str)
             if response != 'False': # If response if informative, continue to next loop/question
                 pprint("This is the list of text show up on the right scroll box")
@@ -141,9 +266,7 @@ class Application():
             
             # search metadata space
             metadatas,metadatas_score_points = self.retriever.search_metadata_space(query_embedding)
-            document_str = ""
-            for i,metadata in enumerate(metadatas):
-                document_str += f"Document {i}:\n{metadata}\n\n"
+            document_str = self.context_packer.pack(metadatas, [point.id for point in metadatas_score_points])
             response = self.generator.check_informative(user_query=query,documents_str=document_str)
             if response != 'False': # If response if informative, continue to next loop/question
                 pprint("This is the list of text show up on the right scroll box")
@@ -156,12 +279,10 @@ class Application():
             # if both search fail, search internet and try again
             search_query = self.query_preprocessor.process_query_for_search(query)
             # Modify for async
-            asyncio.run(self.search_internet(search_query=search_query))
+            self.search_internet(search_query=search_query)
             # Re-search vector store
-            texts, text_score_points  = self.retriever.search_text_space(query_embedding)
-            document_str = ""
-            for i,text in enumerate(texts):
-                document_str += f"Document {i}:\n{text}\n\n"
+            texts, text_score_points  = self._search_texts(query_embedding, float_query_embedding)
+            document_str = self.context_packer.pack(texts, [point.id for point in text_score_points])
             response = self.generator.check_informative(user_query=query,documents_str=document_str)
             pprint("This is the list of text show up on the right scroll box")
             pprint(texts)
@@ -174,9 +295,7 @@ class Application():
                 continue   
 
             metadatas,metadatas_score_points = self.retriever.search_metadata_space(query_embedding)
-            document_str = ""
-            for i,metadata in enumerate(metadatas):
-                document_str += f"Document {i}:\n{metadata}\n\n"
+            document_str = self.context_packer.pack(metadatas, [point.id for point in metadatas_score_points])
             response = self.generator.generate(query,document_str)
             pprint("RELOAD THE RIGHT SCROLL BOX, This is the list of text show up on the right scroll box")
             pprint(metadatas)
@@ -192,7 +311,11 @@ class Application():
         Process a single query, interact with the retriever, generator, and 
         possibly internet search, and return a JSON-friendly dictionary of results.
 
-        process_query function is the API endpoint version of the begin function
+        process_query function is the API endpoint version of the begin function.
+        Blocking stages run in self.pipeline and LLM calls use the async OpenAI client,
+        so the event loop keeps serving other clients while this query waits.
+        LLM answers are streamed: the client gets STREAMING updates with the answer generated so far,
+        and a 'False' (not informative) verdict aborts the stream and moves on to the next phase.
         """
         # get query_embedding and search images space
         result = {
@@ -211,84 +334,69 @@ class Application():
             "final_response": None,
             "search_phase": ""
         }
-        # # Get query_embedding and search image space
-        query_embedding = self.text_embed_model._get_embeddings_for_image_query(query)
-        img_urls, image_score_points = self.retriever.search_image_space(query_embedding)
+        pipeline = self.pipeline
+        query_embedding = await pipeline.run_blocking('embed', self.query_embedding_cache.get_embedding, query)
 
-        result["images"]["urls"] = img_urls
-        result["images"]["fragment_ids"] = [image_score_point.id for image_score_point in image_score_points]
-
-        # Quantize query embedding
+        # Quantize query embedding, the float embedding is kept for the image space and to rescore text candidates
+        float_query_embedding = query_embedding
         query_embedding = binary_quantized(query_embedding)
 
-        # Search text space
-        texts, text_score_points = self.retriever.search_text_space(query_embedding)
-        result["texts"]["documents"] = texts
-        result["texts"]["fragment_ids"] = [text_score_point.id for text_score_point in text_score_points]
-
-        # Attempt to generate an informative response from text results
-        document_str = ""
-        for i, text in enumerate(texts):
-            document_str += f"Document {i}:\n{text}\n\n"
-        response = self.generator.check_informative(user_query=query, documents_str=document_str)
-        if response != 'False':
-            result["final_response"] = response
-            result["search_phase"] = "text_space"
-            query_sessions[client_id] = QuerySession(QueryState.SUCCESS, result)
-            return
-
-        # # Search metadata space if text not informative enough
-        metadatas, metadatas_score_points = self.retriever.search_metadata_space(query_embedding)
-        # result["metadatas"]["documents"] = metadatas
-        # result["metadatas"]["score_points_id"] = metadatas_score_points
-
-        document_str = ""
-        for i, metadata in enumerate(metadatas):
-            document_str += f"Document {i}:\n{metadata}\n\n"
-        response = self.generator.check_informative(user_query=query, documents_str=document_str)
-        if response != 'False':
+        # Answers are streamed to the client as they are generated, the SUCCESS update carries the full answer
+        sink = self._partial_publisher(query_sessions, client_id)
+
+        # Search image, text and metadata space and check if texts or metadatas answer the query
+        if self.speculative_search:
+            response, search_phase, document_str = await self._search_local_speculative(query, query_embedding, float_query_embedding, result, sink)
+        else:
+            response, search_phase, document_str = await self._search_local(query, query_embedding, float_query_embedding, result, sink)
+        # Texts retrieved before any internet search, the evidence part of the answer cache key
+        evidence_ids = list(result["texts"]["fragment_ids"])
+        if response is not None:
             result["final_response"] = response
-            result["search_phase"] = "metadata_space"
-            query_sessions[client_id] = QuerySession(QueryState.SUCCESS, result)
+            result["search_phase"] = search_phase
+            self._answer(query_sessions, client_id, result, query_embedding, evidence_ids)
             return
 
         # If both text and metadata search fail, try internet search
-        query_sessions[client_id] = QuerySession(QueryState.SEARCHING_INTERNET, result)
+        self._publish(query_sessions, client_id, QueryState.SEARCHING_INTERNET, result)
         await asyncio.sleep(0)  # Allow the consumer to process the query
-        search_query = self.query_preprocessor.process_query_for_search(query)
-        # Modify for async
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
-            res = await loop.run_in_executor(executor, self.search_internet, search_query)
-            if res == False:
-                query_sessions[client_id] = QuerySession(QueryState.SUCCESS, result)
-                return
+        search_query = await pipeline.run_async('llm', self.query_preprocessor.aprocess_query_for_search, query)
+        try:
+            crawl, queue_position = self.crawl_scheduler.submit(search_query)
+        except CrawlQueueFull:
+            # Too many internet searches waiting, answer from the local metadata instead of queueing one more
+            result["final_response"] = await self._stream_llm(self.generator.astream_generate(query, document_str), sink)
+            result["search_phase"] = "metadata_space"
+            self._answer(query_sessions, client_id, result, query_embedding, evidence_ids)
+            return
+        if queue_position > 0:
+            result["queue_position"] = queue_position
+            self._publish(query_sessions, client_id, QueryState.QUEUED, result)
+        res = await asyncio.wrap_future(crawl)
+        result.pop("queue_position", None)
+        if res == False:
+            self._answer(query_sessions, client_id, result, query_embedding, evidence_ids)
+            return
 
         # Re-search text space after internet search
-        texts, text_score_points = self.retriever.search_text_space(query_embedding)
-        result["texts"]["documents"] = texts
-        # Get ids from text_score_points
-        result["texts"]["fragment_ids"] = [text_score_point.id for text_score_point in text_score_points]
+        texts, text_score_points = await pipeline.run_blocking('search', self._search_texts, query_embedding, float_query_embedding)
+        self._set_texts(result, texts, text_score_points)
 
-        document_str = ""
-        for i, text in enumerate(texts):
-            document_str += f"Document {i}:\n{text}\n\n"
-        response = self.generator.check_informative(user_query=query, documents_str=document_str)
-        if response != 'False':
+        document_str = self.context_packer.pack(texts, [point.id for point in text_score_points])
+        response = await self._stream_llm(self.generator.astream_check_informative(query, document_str), sink)
+        if response is not None:
             result["final_response"] = response
             result["search_phase"] = "text_space_after_internet"
-            query_sessions[client_id] = QuerySession(QueryState.SUCCESS, result)
+            self._answer(query_sessions, client_id, result, query_embedding, evidence_ids)
             return
 
         # If still not informative, re-search metadata space after internet search
-        metadatas, metadatas_score_points = self.retriever.search_metadata_space(query_embedding)
+        metadatas, metadatas_score_points = await pipeline.run_blocking('search', self.retriever.search_metadata_space, query_embedding)
         # result["metadatas"]["documents"] = metadatas
         # result["metadatas"]["score_points"] = metadatas_score_points
 
-        document_str = ""
-        for i, metadata in enumerate(metadatas):
-            document_str += f"Document {i}:\n{metadata}\n\n"
-        response = self.generator.generate(query, document_str)
+        document_str = self.context_packer.pack(metadatas, [point.id for point in metadatas_score_points])
+        response = await self._stream_llm(self.generator.astream_generate(query, document_str), sink)
         # result["final_response"] = response
         # result["search_phase"] = "metadata_space_after_internet"
         # metadatas,metadatas_score_points = self.retriever.search_metadata_space(query_embedding)
@@ -301,43 +409,228 @@ class Application():
         #     document_str += f"Document {i}:\n{metadata}\n\n"
         # response = self.generator.generate(query,document_str)
         result["final_response"] = response
-        query_sessions[client_id] = QuerySession(QueryState.SUCCESS, result)
+        self._answer(query_sessions, client_id, result, query_embedding, evidence_ids)
 
-    
-    def search_internet(self,search_query:str,n_cnn:int=2,n_medium:int=4) -> bool:
+    async def _search_local(self, query: str, query_embedding: ndarray, float_query_embedding: ndarray, result: dict, sink: Callable[[str], None]) -> Tuple[str | None, str, str]:
         """
-        Function to crawl realtime posts on CNN and medium
+        Local part of the cascade, one step after the other: image space, text space, LLM check,
+        then metadata space and a second LLM check only if the texts are not informative.
+        Fills the images and texts of result, an informative answer is streamed to sink.
 
-        Results:
-            - n posts on medium and cnn save to local json database
-            - new vectors added to RAM in the current session
+        Returns:
+            - Tuple[str | None, str, str]: informative response (None if neither space is informative),
+            search phase of the response, and the metadata documents string (for the answer without internet)
         """
-        try: 
-            self.indexer.crawl_both(search_query, n_cnn, n_medium)
+        pipeline = self.pipeline
+        img_urls, image_score_points = await pipeline.run_blocking('search', self.retriever.search_image_space, float_query_embedding)
+        self._set_images(result, img_urls, image_score_points)
 
-            contents = self.indexer.get_content_embeddings()
+        texts, text_score_points = await pipeline.run_blocking('search', self._search_texts, query_embedding, float_query_embedding)
+        self._set_texts(result, texts, text_score_points)
+        cached = self._cached_answer(query_embedding, result)
+        if cached is not None:
+            return cached
 
-            metadatas = self.indexer.get_metadata_items_embeddings()
+        # Attempt to generate an informative response from text results
+        document_str = self.context_packer.pack(texts, [point.id for point in text_score_points])
+        response = await self._stream_llm(self.generator.astream_check_informative(query, document_str), sink)
+        if response is not None:
+            return response, "text_space", ""
+
+        # Search metadata space if text not informative enough
+        metadatas, metadatas_score_points = await pipeline.run_blocking('search', self.retriever.search_metadata_space, query_embedding)
+        document_str = self.context_packer.pack(metadatas, [point.id for point in metadatas_score_points])
+        response = await self._stream_llm(self.generator.astream_check_informative(query, document_str), sink)
+        if response is not None:
+            return response, "metadata_space", document_str
+        return None, "", document_str
+
+    async def _search_local_speculative(self, query: str, query_embedding: ndarray, float_query_embedding: ndarray, result: dict, sink: Callable[[str], None]) -> Tuple[str | None, str, str]:
+        """
+        Same as _search_local, but the three space searches run concurrently and both LLM checks
+        are issued at once. The text answer still wins over the metadata answer, the metadata check is
+        cancelled when the texts are informative. The local path costs one LLM round-trip instead of two,
+        at the price of a metadata check that is sometimes wasted.
+        The metadata answer is held back (DeltaRelay) until the texts turn out not informative.
+        """
+        pipeline = self.pipeline
+        (img_urls, image_score_points), (texts, text_score_points), (metadatas, metadatas_score_points) = await asyncio.gather(
+            pipeline.run_blocking('search', self.retriever.search_image_space, float_query_embedding),
+            pipeline.run_blocking('search', self._search_texts, query_embedding, float_query_embedding),
+            pipeline.run_blocking('search', self.retriever.search_metadata_space, query_embedding),
+        )
+        self._set_images(result, img_urls, image_score_points)
+        self._set_texts(result, texts, text_score_points)
+        cached = self._cached_answer(query_embedding, result)
+        if cached is not None:
+            return cached
+
+        text_document_str = self.context_packer.pack(texts, [point.id for point in text_score_points])
+        metadata_document_str = self.context_packer.pack(metadatas, [point.id for point in metadatas_score_points])
+        metadata_relay = DeltaRelay()
+        text_check = asyncio.ensure_future(
+            self._stream_llm(self.generator.astream_check_informative(query, text_document_str), sink)
+        )
+        metadata_check = asyncio.ensure_future(
+            self._stream_llm(self.generator.astream_check_informative(query, metadata_document_str), metadata_relay)
+        )
+        try:
+            response = await text_check
+            if response is not None:
+                return response, "text_space", ""
+            metadata_relay.attach(sink)
+            response = await metadata_check
+            if response is not None:
+                return response, "metadata_space", metadata_document_str
+            return None, "", metadata_document_str
+        finally:
+            metadata_check.cancel()
+
+    async def _stream_llm(self, deltas: AsyncIterator[str], sink: Callable[[str], None]) -> str | None:
+        """
+        Consume a streamed LLM answer within the 'llm' limit of the pipeline, passing every delta to sink.
 
-            images = self.indexer.get_images_items_embeddings()
+        Returns:
+            - str | None: the whole answer, None if nothing was streamed (documents not informative)
+        """
+        parts = []
+        async with self.pipeline.limit('llm'), aclosing(deltas):
+            async for delta in deltas:
+                parts.append(delta)
+                sink(delta)
+        return "".join(parts) if parts else None
+
+    def _partial_publisher(self, query_sessions: dict, client_id: str, min_interval: float = 0.1) -> Callable[[str], None]:
+        """
+        Sink of streamed deltas that sends the answer generated so far to the client, at most every min_interval
+        seconds so the traffic does not grow with the square of the answer length.
+        The deltas of the last interval are not lost: the final answer follows in the SUCCESS update.
+        """
+        parts = []
+        last_publish = 0.0
+        def publish(delta: str) -> None:
+            nonlocal last_publish
+            parts.append(delta)
+            now = time.monotonic()
+            if now - last_publish < min_interval:
+                return
+            session = query_sessions.get(client_id)
+            if session is not None:
+                last_publish = now
+                session.publish_partial("".join(parts))
+        return publish
 
-            for item in contents:
-                for id, value in item.items():
-                    self.retriever.add_point_to_text_space(id, base64_to_binary_array(value["embedding"]))
+    def _set_images(self, result: dict, img_urls: List[str], image_score_points: List[ScoredPoint]) -> None:
+        result["images"]["urls"] = img_urls
+        result["images"]["fragment_ids"] = [image_score_point.id for image_score_point in image_score_points]
 
-            for item in metadatas:
-                for id, value in item.items():
-                    self.retriever.add_point_to_metadata_space(id, base64_to_binary_array(value))
+    def _set_texts(self, result: dict, texts: List[str], text_score_points: List[ScoredPoint]) -> None:
+        result["texts"]["documents"] = texts
+        result["texts"]["fragment_ids"] = [text_score_point.id for text_score_point in text_score_points]
 
-            for item in images:
-                for id, value in item.items():
-                    self.retriever.add_point_to_image_space(id, base64_to_float32_vector(value["embedding"]))
+    def _cached_answer(self, query_embedding: ndarray, result: dict) -> Tuple[str, str, str] | None:
+        """Answer of a near-identical query that retrieved the same texts, in the return format of _search_local"""
+        cached = self.answer_cache.lookup(query_embedding, result["texts"]["fragment_ids"])
+        if cached is None:
+            return None
+        result["cached"] = True
+        return cached.response, cached.search_phase, ""
+
+    def _answer(self, query_sessions: dict, client_id: str, result: dict, query_embedding: ndarray, evidence_ids: List[str]) -> None:
+        """Publish the final result and cache its answer"""
+        if result["final_response"] and not result.get("cached"):
+            self.answer_cache.store(query_embedding, evidence_ids, result["final_response"], result["search_phase"])
+        self._publish(query_sessions, client_id, QueryState.SUCCESS, result)
+
+    def _publish(self, query_sessions: dict, client_id: str, state: QueryState, result: dict) -> None:
+        """Push a state transition to the client's session, unless the client already disconnected"""
+        session = query_sessions.get(client_id)
+        if session is not None:
+            session.publish(state, result)
 
-            self.indexer.clear_data()
+    def search_internet(self,search_query:str,n_cnn:int=2,n_medium:int=4) -> bool:
+        """
+        Function to crawl realtime posts on CNN and medium
+
+        Results:
+            - n posts on medium and cnn save to local json database
+            - new vectors added to RAM in the current session
+        """
+        try: 
+            posts = self.indexer.crawl_both(search_query, n_cnn, n_medium, into=CrawlResult())
+
+            contents = posts.get_content_embeddings()
+
+            metadatas = posts.get_metadata_items()
+
+            images = posts.get_images_items_embeddings()
+
+            post_ids = (
+                {id for item in metadatas for id in item}
+                | {post_id_of(id) for item in contents for id in item}
+                | {post_id_of(id) for item in images for id in item}
+            )
+            self._invalidate_posts(post_ids)
+            # A re-crawled post replaces its points, as in insert_doc
+            for post_id in post_ids:
+                self._remove_post_points(post_id)
+
+            # Decode every new vector of a space in one call and append them as a single batch
+            text_items = [(id, value) for item in contents for id, value in item.items()]
+            if text_items:
+                ids, values = zip(*text_items)
+                self.retriever.add_points_to_text_space(
+                    list(ids),
+                    base64_batch_to_packed_matrix([value["embedding"] for value in values]),
+                    texts=[value["content"] for value in values],
+                )
+                rescore_items = [(id, value["rescore_embedding"]) for id, value in text_items if value.get("rescore_embedding")]
+                if rescore_items:
+                    ids, embeddings = zip(*rescore_items)
+                    self.retriever.add_points_to_text_rescore(list(ids), base64_batch_to_int8_matrix(embeddings))
+
+            metadata_items = [(id, value) for item in metadatas for id, value in item.items()]
+            if metadata_items:
+                ids, values = zip(*metadata_items)
+                self.retriever.add_points_to_metadata_space(
+                    list(ids),
+                    base64_batch_to_packed_matrix([value["embedding"] for value in values]),
+                    metadatas=[format_metadata(value) for value in values],
+                )
+
+            image_items = [(id, value) for item in images for id, value in item.items()]
+            if image_items:
+                ids, values = zip(*image_items)
+                self.retriever.add_points_to_image_space(
+                    list(ids),
+                    base64_batch_to_float32_matrix([value["embedding"] for value in values]),
+                    image_urls=[value["image_url"] for value in values],
+                )
+
+            posts.clear_data()
             return True
         except Exception:
             return False
 
+    def _search_texts(self, query_embedding:ndarray, float_query_embedding:ndarray):
+        """
+        Search text space. When the retriever has int8 vectors, Hamming candidates are rescored
+        against them and fewer (better ranked) texts are returned, to save LLM tokens.
+
+        Args:
+            - query_embedding (ndarray): binary quantized query embedding
+            - float_query_embedding (ndarray): float32 query embedding
+        Returns:
+            - Tuple[List[str], List[ScoredPoint]]: texts and results
+        """
+        if len(self.retriever.text_rescore) > 0:
+            return self.retriever.search_text_space(
+                query_embedding,
+                top_k=self.rescored_text_top_k,
+                rescore_query=float_query_embedding,
+            )
+        return self.retriever.search_text_space(query_embedding, top_k=self.text_top_k)
+
     def preprocess_query(self, user_query:str, k:int =3):
         """
         Preprocess query, if user is not confident about the thing they describe,
@@ -351,6 +644,10 @@ class Application():
             - List[str]: a list of refined queries
         """
         return self.query_preprocessor.preprocess_query(query=user_query,k=k)
+
+    async def apreprocess_query(self, user_query:str, k:int =3):
+        """Async version of preprocess_query, within the 'llm' limit of the pipeline"""
+        return await self.pipeline.run_async('llm', self.query_preprocessor.apreprocess_query, query=user_query, k=k)
     
     def _search_text_space(self, user_query:str, top_k: int=8) -> List[ScoredPoint]:
         """
@@ -367,34 +664,22 @@ class Application():
         [ScoredPoint(id='medium_c20340289683_text_12', version=0, score=25094.0, payload={}, vector=None, shard_key=None, order_value=None), 
         ScoredPoint(id='medium_610bbb304850_text_3', version=0, score=25853.0, payload={}, vector=None, shard_key=None, order_value=None)]
         """
-        query_embedding = self.text_embed_model._get_embeddings_for_image_query(user_query)
+        query_embedding = self.query_embedding_cache.get_embedding(user_query)
         query_embedding = binary_quantized(query_embedding)
-        search_results = self.retriever.qdrant_local.search(
-            collection_name='text_space',
-            query_vector=query_embedding,
-            limit=top_k,
-        )
+        search_results = self.retriever.text_space.search(query_vector=query_embedding, top_k=top_k)
         return search_results
     
     def _search_metadata_space(self, user_query:str, top_k:int = 8) -> List[ScoredPoint]:
         """Like above"""
-        query_embedding = self.text_embed_model._get_embeddings_for_image_query(user_query)
+        query_embedding = self.query_embedding_cache.get_embedding(user_query)
         query_embedding = binary_quantized(query_embedding)
-        search_results = self.retriever.qdrant_local.search(
-            collection_name='metadata_space',
-            query_vector=query_embedding,
-            limit=top_k,
-        )
+        search_results = self.retriever.metadata_space.search(query_vector=query_embedding, top_k=top_k)
         return search_results
     
     def _search_image_space(self, user_query:str, top_k:int =8) -> List[ScoredPoint]:
         """Like above but for images"""
-        query_embedding = self.text_embed_model._get_embeddings_for_image_query(user_query)
-        search_results = self.retriever.qdrant_local.search(
-            collection_name='image_space',
-            query_vector=query_embedding,
-            limit=top_k,
-        )
+        query_embedding = self.query_embedding_cache.get_embedding(user_query)
+        search_results = self.retriever.image_space.search(query_vector=query_embedding, top_k=top_k)
         return search_results
     
     def get_all_text_from_fragment_id(self, point_id:str) -> str:
@@ -411,13 +696,24 @@ class Application():
         Returns:
             - str: Concated string of all text element in that document
         """
-        post_id = point_id.split('_text_')[0].split('_image_')[0]
+        post_id = post_id_of(point_id)
+        ingesting = self._ingesting.get(post_id)
+        if ingesting is not None: # pdf still being streamed, its json is not written yet
+            return ''.join(text + "\n" for text in list(ingesting))
+        output_str = self.article_cache.get(post_id)
+        if output_str is not None:
+            return output_str
         json_file_path = os.path.join(self.retriever.database_path, f"{post_id}.json")
         with open(json_file_path, 'r', encoding='utf-8') as json_file:
             document_data = json.load(json_file)
         content_dict = document_data['content']
-        output_str = ''
-        for key,value in content_dict.items():
-            chunked_text = value['content'] + "\n"
-            output_str +=chunked_text
+        output_str = ''.join(value['content'] + "\n" for value in content_dict.values())
+        self.article_cache.put(post_id, output_str)
         return output_str
+
+    def _invalidate_posts(self, post_ids) -> None:
+        """Drop cached data of posts whose json was (re)written"""
+        post_ids = set(post_ids)
+        for post_id in post_ids:
+            self.article_cache.pop(post_id)
+        self.answer_cache.invalidate_posts(post_ids)
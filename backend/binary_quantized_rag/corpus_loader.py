@@ -0,0 +1,194 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+import numpy as np
+from ..utils import base64_batch_to_packed_matrix, base64_batch_to_float32_matrix, base64_batch_to_int8_matrix
+from .document_store import format_metadata
+
+# Below this number of files the thread pool costs more than it saves
+MIN_FILES_FOR_POOL = 64
+
+class Corpus():
+    """
+    Vectors of the whole json database, read in a single pass and grouped by space.
+
+    Attributes:
+        text_ids (List[str]), text_vectors (np.ndarray): packed uint8 matrix, one row per chunked text
+        image_ids (List[str]), image_vectors (np.ndarray): float32 matrix, one row per image
+        metadata_ids (List[str]), metadata_vectors (np.ndarray): packed uint8 matrix, one row per post
+        texts, image_urls, metadatas (List[str]): string shown for each id after a search, aligned with the ids
+        text_rescore_ids (List[str]), text_rescore_vectors (np.ndarray): int8 matrix, one row per chunked text
+            that has a 'rescore_embedding'
+    """
+    def __init__(self, vector_size: int = 768):
+        self.text_ids: List[str] = []
+        self.image_ids: List[str] = []
+        self.metadata_ids: List[str] = []
+        self.texts: List[str] = []
+        self.image_urls: List[str] = []
+        self.metadatas: List[str] = []
+        self.text_rescore_ids: List[str] = []
+        self._text_rescore_vectors: List[np.ndarray] = []
+        self._text_vectors: List[np.ndarray] = []
+        self._image_vectors: List[np.ndarray] = []
+        self._metadata_vectors: List[np.ndarray] = []
+        self.vector_size = vector_size
+
+    def _extend(self, document: Dict[str, Any]) -> None:
+        self.text_ids.extend(document['text_ids'])
+        self._text_vectors.append(document['text_vectors'])
+        self.image_ids.extend(document['image_ids'])
+        self._image_vectors.append(document['image_vectors'])
+        self.metadata_ids.extend(document['metadata_ids'])
+        self._metadata_vectors.append(document['metadata_vectors'])
+        self.texts.extend(document['texts'])
+        self.image_urls.extend(document['image_urls'])
+        self.metadatas.extend(document['metadatas'])
+        self.text_rescore_ids.extend(document['text_rescore_ids'])
+        self._text_rescore_vectors.append(document['text_rescore_vectors'])
+
+    def _stack(self, parts: List[np.ndarray], width: int, dtype) -> np.ndarray:
+        if not parts:
+            return np.zeros((0, width), dtype=dtype)
+        return np.concatenate(parts, axis=0)
+
+    @property
+    def text_vectors(self) -> np.ndarray:
+        return self._stack(self._text_vectors, self.vector_size // 8, np.uint8)
+
+    @property
+    def image_vectors(self) -> np.ndarray:
+        return self._stack(self._image_vectors, self.vector_size, np.float32)
+
+    @property
+    def metadata_vectors(self) -> np.ndarray:
+        return self._stack(self._metadata_vectors, self.vector_size // 8, np.uint8)
+
+    @property
+    def text_rescore_vectors(self) -> np.ndarray:
+        return self._stack(self._text_rescore_vectors, self.vector_size, np.int8)
+
+
+def _pack_binary(embeddings: List[str], vector_size: int) -> np.ndarray:
+    if not embeddings:
+        return np.zeros((0, vector_size // 8), dtype=np.uint8)
+    return base64_batch_to_packed_matrix(embeddings)
+
+def _stack_float32(embeddings: List[str], vector_size: int) -> np.ndarray:
+    if not embeddings:
+        return np.zeros((0, vector_size), dtype=np.float32)
+    return base64_batch_to_float32_matrix(embeddings)
+
+def _stack_int8(embeddings: List[str], vector_size: int) -> np.ndarray:
+    if not embeddings:
+        return np.zeros((0, vector_size), dtype=np.int8)
+    return base64_batch_to_int8_matrix(embeddings)
+
+def _check_width(matrix: np.ndarray, width: int, name: str) -> np.ndarray:
+    if matrix.shape[1] != width:
+        raise ValueError(f"{name} embeddings have {matrix.shape[1]} values, expected {width}")
+    return matrix
+
+def parse_document(file_path: str, vector_size: int = 768) -> Dict[str, Any]:
+    """
+    Read one json document, decode the embeddings of all three spaces and extract the
+    string of each point (chunk text, image url, metadata string).
+
+    Args:
+        file_path (str): Path of the json document
+        vector_size (int): Embedding dimension
+
+    Returns:
+        Dict[str, Any]: ids, decoded vectors and strings of the text, image and metadata spaces
+    Raises:
+        ValueError: An embedding of the document does not have the width of its space
+    """
+    with open(file_path, 'r') as f:
+        data = json.load(f)
+
+    text_ids, text_embeddings, texts = [], [], []
+    text_rescore_ids, text_rescore_embeddings = [], []
+    for key, value in (data.get('content') or {}).items():
+        text_ids.append(key)
+        text_embeddings.append(value.get('embedding'))
+        texts.append(value.get('content', ''))
+        if value.get('rescore_embedding'):
+            text_rescore_ids.append(key)
+            text_rescore_embeddings.append(value['rescore_embedding'])
+
+    image_ids, image_embeddings, image_urls = [], [], []
+    for key, value in (data.get('images') or {}).items():
+        image_ids.append(key)
+        image_embeddings.append(value.get('embedding'))
+        image_urls.append(value.get('image_url', ''))
+
+    metadata_ids, metadata_embeddings, metadatas = [], [], []
+    post_id = data.get('id')
+    if post_id is not None and post_id in data.get('metadata', {}):
+        metadata_ids.append(post_id)
+        metadata_embeddings.append(data['metadata'][post_id]['embedding'])
+        metadatas.append(format_metadata(data['metadata'][post_id]))
+
+    return {
+        'text_ids': text_ids,
+        'text_vectors': _check_width(_pack_binary(text_embeddings, vector_size), vector_size // 8, 'text'),
+        'texts': texts,
+        'text_rescore_ids': text_rescore_ids,
+        'text_rescore_vectors': _check_width(_stack_int8(text_rescore_embeddings, vector_size), vector_size, 'rescore'),
+        'image_ids': image_ids,
+        'image_vectors': _check_width(_stack_float32(image_embeddings, vector_size), vector_size, 'image'),
+        'image_urls': image_urls,
+        'metadata_ids': metadata_ids,
+        'metadata_vectors': _check_width(_pack_binary(metadata_embeddings, vector_size), vector_size // 8, 'metadata'),
+        'metadatas': metadatas,
+    }
+
+def _parse_document_safe(args) -> Dict[str, Any] | None:
+    file_path, vector_size = args
+    try:
+        return parse_document(file_path, vector_size)
+    except Exception as e:
+        print(f"WARNING: Skipping {file_path}, cannot load it: {e}")
+        return None
+
+def load_corpus(database_path: str, vector_size: int = 768, max_workers: int | None = None) -> Corpus:
+    """
+    Read every json of the database exactly once and fan the content, image and metadata
+    embeddings out to their spaces. A file that cannot be parsed, or whose embeddings do not
+    have the width of their space, is skipped with a warning.
+
+    Files are parsed by a thread pool, which overlaps the file reads. A process pool is not used:
+    this runs in Retriever.__init__, in a process that already has torch, tokenizer and server
+    threads, so forking could deadlock on their locks, and with 'spawn' or 'forkserver' every
+    worker would re-import the backend package, which builds the Application.
+
+    Args:
+        database_path (str): Directory of json documents
+        vector_size (int): Embedding dimension
+        max_workers (int | None): Number of threads, default is os.cpu_count()
+
+    Returns:
+        Corpus: ids and vectors of every space, in file order
+    """
+    file_paths = sorted(
+        os.path.join(database_path, filename)
+        for filename in os.listdir(database_path)
+        if filename.endswith('.json')
+    )
+    tasks = [(file_path, vector_size) for file_path in file_paths]
+    corpus = Corpus(vector_size=vector_size)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers > 1 and len(tasks) >= MIN_FILES_FOR_POOL:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='corpus-loader') as executor:
+            documents = executor.map(_parse_document_safe, tasks)
+            for document in documents:
+                if document is not None:
+                    corpus._extend(document)
+    else:
+        for task in tasks:
+            document = _parse_document_safe(task)
+            if document is not None:
+                corpus._extend(document)
+    return corpus
@@ -0,0 +1,85 @@
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+def format_metadata(metadata: dict) -> str:
+    """Format the semantic metadata of a post the way it is shown to the LLM (one 'key: value' per line, without the embedding)"""
+    return "\n".join(f"{key}: {value}" for key, value in metadata.items() if key != 'embedding')
+
+def post_id_of(point_id: str) -> str:
+    """Post id of a text, image or metadata point id"""
+    return point_id.split('_text_')[0].split('_image_')[0]
+
+
+class DocumentStore():
+    """
+    Maps a point id to the string shown for it after a search (chunk text, metadata string or image url),
+    so hydrating search results is a lookup instead of parsing the post's json.
+
+    Strings loaded from the snapshot live in one utf-8 blob (usually a read-only np.memmap) indexed by
+    offsets: the string of row i is blob[offsets[i]:offsets[i + 1]]. Strings added at runtime are kept in a dict.
+
+    Attributes:
+        ids (List[str]): Ids of the strings in the blob, row i of the offsets
+    """
+    def __init__(self):
+        self.ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._blob = np.zeros(0, dtype=np.uint8)
+        self._added: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        # A point of the blob replaced at runtime is in both
+        return len(self._rows.keys() | self._added.keys())
+
+    def __contains__(self, point_id: str) -> bool:
+        return point_id in self._added or point_id in self._rows
+
+    @classmethod
+    def from_arrays(cls, ids: List[str], offsets: np.ndarray, blob: np.ndarray) -> 'DocumentStore':
+        """Build a store over an existing offsets array and utf-8 blob without copying them"""
+        if len(offsets) != len(ids) + 1:
+            raise ValueError(f"Expected {len(ids) + 1} offsets, got {len(offsets)}")
+        store = cls()
+        store.ids = list(ids)
+        store._rows = {point_id: row for row, point_id in enumerate(store.ids)}
+        store._offsets = offsets
+        store._blob = blob
+        return store
+
+    def get(self, point_id: str) -> str | None:
+        """Return the string of point_id, or None if it is unknown"""
+        text = self._added.get(point_id)
+        if text is not None:
+            return text
+        row = self._rows.get(point_id)
+        if row is None:
+            return None
+        start, end = self._offsets[row], self._offsets[row + 1]
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def add(self, point_id: str, text: str) -> None:
+        self._added[point_id] = text
+
+    def add_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        self._added.update(items)
+
+    def remove_many(self, point_ids: Iterable[str]) -> None:
+        """Forget the strings of point_ids, blob strings are dropped from the blob at the next to_arrays"""
+        for point_id in point_ids:
+            self._added.pop(point_id, None)
+            self._rows.pop(point_id, None)
+
+    def to_arrays(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Merge blob and runtime strings into (ids, offsets, blob) for the snapshot.
+        A runtime string overrides the blob string with the same id.
+        """
+        ids = [point_id for point_id in self.ids if point_id in self._rows and point_id not in self._added]
+        encoded = [self.get(point_id).encode('utf-8') for point_id in ids]
+        ids.extend(self._added.keys())
+        encoded.extend(text.encode('utf-8') for text in self._added.values())
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return ids, offsets, blob
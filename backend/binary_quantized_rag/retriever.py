@@ -9,11 +9,12 @@ from llama_index.core import VectorStoreIndex, StorageContext
 from llama_index.core import load_index_from_storage
 from llama_index.core.schema import NodeWithScore
 from llama_index.core.vector_stores import VectorStoreQuery, VectorStoreQueryResult
-from qdrant_client.local.qdrant_local import QdrantLocal
-from qdrant_client import QdrantClient, models
 from qdrant_client.conversions.common_types import ScoredPoint
-from qdrant_client.http.models.models import PointStruct, VectorParams
 from ..utils import *
+from .vector_index import BinaryIndex, DenseIndex, RescoreIndex
+from .snapshot import is_snapshot_fresh, load_snapshot, save_snapshot
+from .corpus_loader import load_corpus
+from .document_store import DocumentStore, post_id_of
 import numpy as np
 
 class Retriever():
@@ -22,132 +23,84 @@ class Retriever():
 
     Attributes:
         database_path (str): Path to resource (database + index)
+        snapshot_path (str): Path to the compiled snapshot of the vector spaces, default is <database_path>/snapshot
     """
     def __init__(
         self,
         database_path:str='./resources/quantized-db',
         vector_size: int = 768,
+        snapshot_path: str | None = None,
     ):
         self.database_path = database_path
+        self.snapshot_path = snapshot_path or os.path.join(database_path, 'snapshot')
         self.vector_size = vector_size
-        self.qdrant_local = QdrantLocal(location=":memory:")
         self.text_space = None
         self.metadata_space = None
         self.image_space = None
+        self.text_rescore = RescoreIndex(vector_size=vector_size)
+        # Strings shown for each point after a search, so results are hydrated without parsing json
+        self.texts = DocumentStore()
+        self.metadatas = DocumentStore()
+        self.image_urls = DocumentStore()
+        self.modified = False # True when points were added since the snapshot was written
         self._setup()
         
-    def _setup_text_space(self):
-        """Prepare the text_space collection"""
-        # TODO this code can be optimized
-        self.qdrant_local.create_collection(
-            collection_name='text_space',
-            vectors_config=VectorParams(
-                size=self.vector_size,
-                distance=models.Distance.MANHATTAN,
-                quantization_config= models.BinaryQuantization(
-                    binary=models.BinaryQuantizationConfig(
-                        always_ram=True
-                    )
-                ),
-            ),
-        )
-        self.text_space = self.qdrant_local.collections['text_space']
-        
-        n_embeddings = 0
-        for filename in os.listdir(self.database_path):
-            if filename.endswith('.json'):
-                file_path = os.path.join(self.database_path, filename)
-                
-                # Read the JSON file
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
-                    
-                    # Check if 'content' key exists in the file
-                    if 'content' in data and data['content']:
-                        # For each entry in the 'content', extract the embedding
-                        for key, value in data['content'].items():
-                            embedding = base64_to_binary_array(value.get('embedding'))
-                            self.text_space._add_point(
-                                point=PointStruct(
-                                    id = key,
-                                    vector=embedding,
-                                    payload=None
-                                )
-                            )
-                            n_embeddings+=1
-        # shorten and change dtype of vectors
-        self.text_space.vectors[''] = self.text_space.vectors[''].astype(np.uint8)[:n_embeddings]
-                        
-    def search_text_space(self, query_vector:np.ndarray,top_k:int = 16) -> Tuple[List[str],List[ScoredPoint]]:
+    def search_text_space(
+        self,
+        query_vector:np.ndarray,
+        top_k:int = 16,
+        rescore_query:np.ndarray | None = None,
+        oversample:int = 4,
+    ) -> Tuple[List[str],List[ScoredPoint]]:
         """
+        Search the text space by Hamming distance. If rescore_query is given, this is a two-stage search:
+        top_k * oversample candidates are retrieved by Hamming distance, then reranked by cosine similarity
+        between the float query and the stored int8 vectors (see RescoreIndex). The scores of the results
+        are then cosine similarities (higher is closer) instead of Hamming distances.
+        Results without a stored text are dropped, so texts[i] is the text of results[i].
+
         Example usage:
         query = input('User: ')
         query_embedding = embed_model._get_text_embedding(query)
-        query_embedding = binary_quantized(query_embedding)
-        search_text_space(query_embedding)
+        search_text_space(binary_quantized(query_embedding), top_k=8, rescore_query=query_embedding)
         """
-        results = self.qdrant_local.search(
-            collection_name='text_space',
-            query_vector=query_vector,
-            limit=top_k,
-        )
-        return self._get_texts_base_on_search_results(results),results
-    
-    def _get_texts_base_on_search_results(self, results:List[ScoredPoint])->List[str]:
-        texts = []
-        for result in results:
-            id = result.id
-            post_id = id.split('_text_')[0]
-            json_file_path = os.path.join(self.database_path, f"{post_id}.json")
+        if rescore_query is None or len(self.text_rescore) == 0:
+            results = self.text_space.search(query_vector=query_vector, top_k=top_k)
+            return self._get_texts_base_on_search_results(results)
+        candidates = self.text_space.search(query_vector=query_vector, top_k=top_k * oversample)
+        results = self._rescore(candidates, rescore_query)[:top_k]
+        return self._get_texts_base_on_search_results(results)
 
-            # Check if the file exists
-            if os.path.exists(json_file_path):
-                # Open the JSON file and load its data
-                with open(json_file_path, 'r') as file:
-                    data = json.load(file)
+    def _rescore(self, candidates:List[ScoredPoint], rescore_query:np.ndarray) -> List[ScoredPoint]:
+        """Rerank Hamming candidates by cosine similarity to the float query"""
+        similarities = self.text_rescore.cosine_similarities(rescore_query, [c.id for c in candidates])
+        # Candidates without a stored vector get the cosine estimated from their Hamming distance
+        # (angle ~ pi * hamming / n_bits for sign quantized vectors)
+        hamming = np.array([c.score for c in candidates], dtype=np.float32)
+        estimates = np.cos(np.pi * hamming / self.vector_size)
+        similarities = np.where(np.isnan(similarities), estimates, similarities)
+        order = np.argsort(-similarities, kind='stable')
+        return [
+            ScoredPoint(id=candidates[i].id, version=0, score=float(similarities[i]), payload={}, vector=None)
+            for i in order
+        ]
 
-                # Retrieve the image URL from the JSON structure
-                text = data['content'][result.id]['content']
-                texts.append(text)
-        return texts
+    def _get_texts_base_on_search_results(self, results:List[ScoredPoint])->Tuple[List[str],List[ScoredPoint]]:
+        return self._hydrate(self.texts, results)
 
-    
-    def _setup_image_space(self):
-        """Prepare the image_space collection"""
-        # TODO this code can be optimized
-        self.qdrant_local.create_collection(
-            collection_name='image_space',
-            vectors_config=VectorParams(
-                size=self.vector_size,
-                distance=models.Distance.COSINE,
-            ),
-        )
-        self.image_space = self.qdrant_local.collections['image_space']
-        
-        n_embeddings = 0
-        for filename in os.listdir(self.database_path):
-            if filename.endswith('.json'):
-                file_path = os.path.join(self.database_path, filename)
-                
-                # Read the JSON file
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
-                    
-                    # Check if 'content' key exists in the file
-                    if 'images' in data and data['images']:
-                        # For each entry in the 'content', extract the embedding
-                        for key, value in data['images'].items():
-                            embedding = base64_to_float32_vector(value.get('embedding'))
-                            self.image_space._add_point(
-                                point=PointStruct(
-                                    id = key,
-                                    vector=embedding,
-                                    payload=None
-                                )
-                            )
-                            n_embeddings+=1
-        # shorten and change dtype of vectors
-        self.image_space.vectors[''] = self.image_space.vectors[''].astype(np.float32)[:n_embeddings]
+    def _hydrate(self, store: DocumentStore, results:List[ScoredPoint]) -> Tuple[List[str],List[ScoredPoint]]:
+        """
+        Look up the string of each result in a document store. Results without a string are dropped from both
+        returned lists, so strings[i] is always the string of results[i].
+        """
+        strings = []
+        hydrated = []
+        for result in results:
+            string = store.get(result.id)
+            if string is not None:
+                strings.append(string)
+                hydrated.append(result)
+        return strings, hydrated
 
     def search_image_space(self, query_vector:np.ndarray,top_k:int = 8) -> Tuple[List[str],List[ScoredPoint]]:
         """
@@ -156,106 +109,73 @@ class Retriever():
         query_embedding = text_embed_model._get_embeddings_for_image_query(query)
         search_image_space(query_embedding)
         """
-        results =  self.qdrant_local.search(
-            collection_name='image_space',
-            query_vector=query_vector,
-            limit=top_k,
-        )
-        return self._get_images_based_on_search_results(results),results
+        results = self.image_space.search(query_vector=query_vector, top_k=top_k)
+        return self._get_images_based_on_search_results(results)
     
-    def _setup_metadata_space(self):
-        """Prepare the metadata_space collection"""
-        # TODO this code can be optimized
-        self.qdrant_local.create_collection(
-            collection_name='metadata_space',
-            vectors_config=VectorParams(
-                size=self.vector_size,
-                distance=models.Distance.MANHATTAN,
-                quantization_config= models.BinaryQuantization(
-                    binary=models.BinaryQuantizationConfig(
-                        always_ram=True
-                    )
-                ),
-            ),
-        )
-        self.metadata_space = self.qdrant_local.collections['metadata_space']
-        
-        n_embeddings = 0
-        for filename in os.listdir(self.database_path):
-            if filename.endswith('.json'):
-                file_path = os.path.join(self.database_path, filename)
-                
-                # Read the JSON file
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
-                    
-                    # Check if 'content' key exists in the file
-                    if 'id' in data:
-                        # For each entry in the 'content', extract the embedding
-                        dynamic_id = data['id']
-                        if dynamic_id not in data['metadata']:
-                            continue
-                        embedding = base64_to_binary_array(data['metadata'][dynamic_id]['embedding'])
-                        self.metadata_space._add_point(
-                            point=PointStruct(
-                                id = dynamic_id,
-                                vector=embedding,
-                                payload=None
-                            )
-                        )
-                        n_embeddings+=1
-        # shorten and change dtype of vectors
-        self.metadata_space.vectors[''] = self.metadata_space.vectors[''].astype(np.uint8)[:n_embeddings]
-
     def search_metadata_space(self, query_vector:np.ndarray,top_k:int = 8)->Tuple[List[str],List[ScoredPoint]]:
         """Same for search_text_space"""
-        results =  self.qdrant_local.search(
-            collection_name='metadata_space',
-            query_vector=query_vector,
-            limit=top_k,
-        )
-        return self._get_metadatas_base_on_search_results(results),results
+        results = self.metadata_space.search(query_vector=query_vector, top_k=top_k)
+        return self._get_metadatas_base_on_search_results(results)
     
-    def _get_metadatas_base_on_search_results(self,results:List[ScoredPoint])->List[str]:
-        metadatas = []
-        for result in results:
-            post_id = result.id
-            json_file_path = os.path.join(self.database_path, f"{post_id}.json")
-
-            # Check if the file exists
-            if os.path.exists(json_file_path):
-                # Open the JSON file and load its data
-                with open(json_file_path, 'r') as file:
-                    data = json.load(file)
-
-                # Retrieve the image URL from the JSON structure
-                metadata = data['metadata'][post_id]
-                metadata_str = "\n".join(f"{key}: {value}" for key, value in metadata.items() if key != 'embedding')
-                metadatas.append(metadata_str)
-        return metadatas
+    def _get_metadatas_base_on_search_results(self,results:List[ScoredPoint])->Tuple[List[str],List[ScoredPoint]]:
+        return self._hydrate(self.metadatas, results)
 
     def _setup(self):
-        self._setup_text_space()
-        self._setup_image_space()
-        self._setup_metadata_space()
+        """Load the spaces from the snapshot if it is up to date, otherwise rebuild them from json and write a new snapshot"""
+        if is_snapshot_fresh(self.snapshot_path, self.database_path):
+            try:
+                self._load_snapshot()
+                return
+            except (OSError, ValueError, KeyError) as e:
+                print(f"WARNING: Cannot load snapshot from {self.snapshot_path}, rebuilding from json: {e}")
+        self._setup_spaces()
+        self.save_snapshot()
 
-    def _get_images_based_on_search_results(self, results:List[ScoredPoint]) -> List[str]:
-        img_urls = []
-        for result in results:
-            id = result.id
-            post_id = id.split('_image_')[0]
-            json_file_path = os.path.join(self.database_path, f"{post_id}.json")
+    def _setup_spaces(self):
+        """Build the text, image and metadata spaces from the json database, reading each file once"""
+        corpus = load_corpus(self.database_path, vector_size=self.vector_size)
+        self.text_space = BinaryIndex.from_arrays(corpus.text_ids, corpus.text_vectors, vector_size=self.vector_size)
+        self.image_space = DenseIndex.from_arrays(corpus.image_ids, corpus.image_vectors, vector_size=self.vector_size, normalize=True)
+        self.metadata_space = BinaryIndex.from_arrays(corpus.metadata_ids, corpus.metadata_vectors, vector_size=self.vector_size)
+        self.text_rescore = RescoreIndex.from_arrays(corpus.text_rescore_ids, corpus.text_rescore_vectors, vector_size=self.vector_size)
+        self.texts.add_many(zip(corpus.text_ids, corpus.texts))
+        self.image_urls.add_many(zip(corpus.image_ids, corpus.image_urls))
+        self.metadatas.add_many(zip(corpus.metadata_ids, corpus.metadatas))
 
-            # Check if the file exists
-            if os.path.exists(json_file_path):
-                # Open the JSON file and load its data
-                with open(json_file_path, 'r') as file:
-                    data = json.load(file)
+    def _load_snapshot(self):
+        spaces, documents = load_snapshot(self.snapshot_path)
+        self.text_space = BinaryIndex.from_arrays(*spaces['text_space'], vector_size=self.vector_size)
+        self.image_space = DenseIndex.from_arrays(*spaces['image_space'], vector_size=self.vector_size)
+        self.metadata_space = BinaryIndex.from_arrays(*spaces['metadata_space'], vector_size=self.vector_size)
+        self.text_rescore = RescoreIndex.from_arrays(*spaces['text_rescore'], vector_size=self.vector_size)
+        self.texts = DocumentStore.from_arrays(*documents['texts'])
+        self.metadatas = DocumentStore.from_arrays(*documents['metadatas'])
+        self.image_urls = DocumentStore.from_arrays(*documents['image_urls'])
 
-                # Retrieve the image URL from the JSON structure
-                img_url = data['images'][result.id]['image_url']
-                img_urls.append(img_url)
-        return img_urls
+    def save_snapshot(self):
+        """Write the current spaces to the snapshot, so the next startup does not have to re-parse the json database"""
+        try:
+            save_snapshot(
+                self.snapshot_path,
+                self.database_path,
+                {
+                    'text_space': (self.text_space.ids, self.text_space.vectors),
+                    'image_space': (self.image_space.ids, self.image_space.vectors),
+                    'metadata_space': (self.metadata_space.ids, self.metadata_space.vectors),
+                    'text_rescore': (self.text_rescore.ids, self.text_rescore.vectors),
+                },
+                {
+                    'texts': self.texts.to_arrays(),
+                    'metadatas': self.metadatas.to_arrays(),
+                    'image_urls': self.image_urls.to_arrays(),
+                },
+            )
+            self.modified = False
+        except OSError as e:
+            print(f"WARNING: Cannot write snapshot to {self.snapshot_path}: {e}")
+
+    def _get_images_based_on_search_results(self, results:List[ScoredPoint]) -> Tuple[List[str],List[ScoredPoint]]:
+        return self._hydrate(self.image_urls, results)
     
     def add_point_to_text_space(self, point_id:str, vector: np.ndarray):
         """
@@ -267,27 +187,11 @@ class Retriever():
         Returns:
             None
         """
-        number_of_vectors = len(self.text_space.vectors[''])
-        self.text_space._add_point(
-            point=PointStruct(
-                id = point_id,
-                vector=vector,
-                payload=None
-            )
-        )
-        self.text_space.vectors[''] = self.text_space.vectors[''][:number_of_vectors+1]
+        self.add_points_to_text_space([point_id], np.asarray(vector)[np.newaxis])
 
     def add_point_to_metadata_space(self, point_id:str, vector: np.ndarray):
         """Same for above"""
-        number_of_vectors = len(self.metadata_space.vectors[''])
-        self.metadata_space._add_point(
-            point=PointStruct(
-                id = point_id,
-                vector=vector,
-                payload=None
-            )
-        )
-        self.metadata_space.vectors[''] = self.metadata_space.vectors[''][:number_of_vectors+1]
+        self.add_points_to_metadata_space([point_id], np.asarray(vector)[np.newaxis])
 
     def add_point_to_image_space(self, point_id:str, vector: np.ndarray):
         """
@@ -300,12 +204,83 @@ class Retriever():
         Returns:
             None
         """
-        number_of_vectors = len(self.image_space.vectors[''])
-        self.image_space._add_point(
-            point=PointStruct(
-                id = point_id,
-                vector=vector,
-                payload=None
-            )
+        self.add_points_to_image_space([point_id], np.asarray(vector)[np.newaxis])
+
+    def add_points_to_text_space(self, point_ids:List[str], vectors: np.ndarray, texts: List[str] | None = None):
+        """
+        Adds a batch of points to the text space, with at most one copy of the space matrix.
+
+        Args:
+            point_ids (List[str]): Unique identifiers of the points to be added.
+            vectors (np.ndarray): Matrix with one row per point, binary quantized (0/1 values)
+                or already packed with np.packbits (see base64_batch_to_packed_matrix).
+            texts (List[str] | None): Chunk text of each point, returned by search_text_space.
+
+        Returns:
+            None
+        """
+        self.text_space.add_points(point_ids, vectors)
+        if texts is not None:
+            self.texts.add_many(zip(point_ids, texts))
+        self.modified = True
+
+    def add_points_to_text_rescore(self, point_ids:List[str], vectors: np.ndarray):
+        """
+        Adds the int8 vectors (utils.scalar_quantized) used to rescore text space candidates.
+
+        Args:
+            point_ids (List[str]): Ids of points of the text space.
+            vectors (np.ndarray): int8 matrix with one row per point.
+        """
+        self.text_rescore.add_points(point_ids, vectors)
+        self.modified = True
+
+    def add_points_to_metadata_space(self, point_ids:List[str], vectors: np.ndarray, metadatas: List[str] | None = None):
+        """Same for above, metadatas are the formatted metadata strings (see format_metadata)"""
+        self.metadata_space.add_points(point_ids, vectors)
+        if metadatas is not None:
+            self.metadatas.add_many(zip(point_ids, metadatas))
+        self.modified = True
+
+    def add_points_to_image_space(self, point_ids:List[str], vectors: np.ndarray, image_urls: List[str] | None = None):
+        """
+        Adds a batch of points to the image space, with at most one copy of the space matrix.
+
+        Args:
+            point_ids (List[str]): Unique identifiers of the points to be added.
+            vectors (np.ndarray): float32 matrix with one row per point.
+            image_urls (List[str] | None): Url of each image, returned by search_image_space.
+
+        Returns:
+            None
+        """
+        self.image_space.add_points(point_ids, vectors)
+        if image_urls is not None:
+            self.image_urls.add_many(zip(point_ids, image_urls))
+        self.modified = True
+
+    def remove_post(self, post_id: str) -> int:
+        """
+        Removes every point of a post (texts, metadata, images and rescore vectors), e.g. before indexing it again.
+
+        Args:
+            post_id (str): Id of the post (see post_id_of)
+
+        Returns:
+            int: Number of removed points, rescore vectors not included
+        """
+        removed = 0
+        for space, store in (
+            (self.text_space, self.texts),
+            (self.metadata_space, self.metadatas),
+            (self.image_space, self.image_urls),
+        ):
+            point_ids = [point_id for point_id in space.ids if post_id_of(point_id) == post_id]
+            removed += space.remove_points(point_ids)
+            store.remove_many(point_ids)
+        self.text_rescore.remove_points(
+            [point_id for point_id in self.text_rescore.ids if post_id_of(point_id) == post_id]
         )
-        self.image_space.vectors[''] = self.image_space.vectors[''][:number_of_vectors+1]
\ No newline at end of file
+        if removed:
+            self.modified = True
+        return removed
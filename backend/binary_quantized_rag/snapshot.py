@@ -0,0 +1,175 @@
+"""
+Compiled snapshot of the vector spaces, so the Retriever does not re-parse every json at startup.
+
+Layout of the snapshot directory:
+    manifest.json         format version, json file count / newest mtime it was built from, current generation,
+                          row count of each space and store
+    gen-<n>/              files of generation n (one pair per space, one triple per document store):
+    <space>.ids           point ids, one per line, row i of the matrix belongs to line i
+    <space>.vectors       raw row-major matrix, loaded with np.memmap
+    <store>.ids           point ids, one per line
+    <store>.offsets       raw int64 array of len(ids) + 1 offsets into the blob
+    <store>.blob          utf-8 strings concatenated, loaded with np.memmap
+
+Every save writes a new generation directory and then swaps the manifest, so files that a running
+Retriever still has open as np.memmap are never overwritten (Windows does not allow replacing them).
+Older generations are deleted when they are no longer mapped.
+"""
+import json
+import os
+import shutil
+from typing import Dict, List, Tuple
+import numpy as np
+
+SNAPSHOT_VERSION = 4
+MANIFEST_FILENAME = 'manifest.json'
+GENERATION_PREFIX = 'gen-'
+
+def scan_database(database_path: str) -> Tuple[int, float]:
+    """
+    Count the json files of the database and find the newest modification time.
+
+    Returns:
+        Tuple[int, float]: (number of json files, newest mtime)
+    """
+    n_files = 0
+    newest_mtime = 0.0
+    with os.scandir(database_path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json') and entry.is_file():
+                n_files += 1
+                newest_mtime = max(newest_mtime, entry.stat().st_mtime)
+    return n_files, newest_mtime
+
+def is_snapshot_fresh(snapshot_path: str, database_path: str) -> bool:
+    """The snapshot is fresh if no json was added, removed or modified since it was written"""
+    manifest = _read_manifest(snapshot_path)
+    if manifest is None or manifest.get('version') != SNAPSHOT_VERSION:
+        return False
+    n_files, newest_mtime = scan_database(database_path)
+    return n_files == manifest['n_files'] and newest_mtime <= manifest['newest_mtime']
+
+def _write_ids(path: str, ids: List[str]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(ids))
+
+def _write_array(path: str, array: np.ndarray) -> None:
+    with open(path, 'wb') as f:
+        f.write(np.ascontiguousarray(array).tobytes())
+
+def _read_manifest(snapshot_path: str) -> dict | None:
+    try:
+        with open(os.path.join(snapshot_path, MANIFEST_FILENAME), 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _generations(snapshot_path: str) -> List[str]:
+    """Generation directory names, oldest first"""
+    names = [
+        entry.name for entry in os.scandir(snapshot_path)
+        if entry.is_dir() and entry.name.startswith(GENERATION_PREFIX) and entry.name[len(GENERATION_PREFIX):].isdigit()
+    ]
+    return sorted(names, key=lambda name: int(name[len(GENERATION_PREFIX):]))
+
+def _remove_old_generations(snapshot_path: str, current: str) -> None:
+    """Delete the generations other than current. A generation still mapped by this process cannot be deleted
+    on Windows, it is left for a later save."""
+    for name in _generations(snapshot_path):
+        if name != current:
+            shutil.rmtree(os.path.join(snapshot_path, name), ignore_errors=True)
+
+def _read_ids(path: str, count: int) -> List[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    ids = content.split('\n') if content else []
+    if len(ids) != count:
+        raise ValueError(f"Snapshot file {path} is corrupted: expected {count} ids, got {len(ids)}")
+    return ids
+
+def _read_array(path: str, dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    if 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+def save_snapshot(
+    snapshot_path: str,
+    database_path: str,
+    spaces: Dict[str, Tuple[List[str], np.ndarray]],
+    documents: Dict[str, Tuple[List[str], np.ndarray, np.ndarray]] | None = None,
+) -> None:
+    """
+    Write the snapshot to a new generation directory, then point the manifest to it (written to a temporary
+    name and renamed), so a crash never leaves a snapshot that looks fresh but is not, and the files of the
+    generation currently memory-mapped are never replaced.
+
+    Args:
+        snapshot_path (str): Snapshot directory
+        database_path (str): Json database the spaces were built from
+        spaces (Dict[str, Tuple[List[str], np.ndarray]]): space name -> (ids, matrix)
+        documents (Dict[str, Tuple[List[str], np.ndarray, np.ndarray]]): store name -> (ids, offsets, utf-8 blob)
+    """
+    os.makedirs(snapshot_path, exist_ok=True)
+    n_files, newest_mtime = scan_database(database_path)
+    generations = _generations(snapshot_path)
+    number = int(generations[-1][len(GENERATION_PREFIX):]) + 1 if generations else 0
+    generation = f'{GENERATION_PREFIX}{number}'
+    generation_path = os.path.join(snapshot_path, generation)
+    os.makedirs(generation_path)
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'n_files': n_files,
+        'newest_mtime': newest_mtime,
+        'generation': generation,
+        'spaces': {},
+        'documents': {},
+    }
+    for name, (ids, matrix) in spaces.items():
+        _write_ids(os.path.join(generation_path, f'{name}.ids'), ids)
+        _write_array(os.path.join(generation_path, f'{name}.vectors'), matrix)
+        manifest['spaces'][name] = {
+            'count': len(ids),
+            'dtype': matrix.dtype.str,
+            'width': matrix.shape[1],
+        }
+    for name, (ids, offsets, blob) in (documents or {}).items():
+        _write_ids(os.path.join(generation_path, f'{name}.ids'), ids)
+        _write_array(os.path.join(generation_path, f'{name}.offsets'), offsets.astype(np.int64))
+        _write_array(os.path.join(generation_path, f'{name}.blob'), blob)
+        manifest['documents'][name] = {
+            'count': len(ids),
+            'size': len(blob),
+        }
+    manifest_path = os.path.join(snapshot_path, MANIFEST_FILENAME)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    _remove_old_generations(snapshot_path, generation)
+
+def load_snapshot(snapshot_path: str) -> Tuple[Dict[str, Tuple[List[str], np.ndarray]], Dict[str, Tuple[List[str], np.ndarray, np.ndarray]]]:
+    """
+    Load every space and document store of the snapshot. Matrices and blobs are read-only
+    np.memmap, so pages are only read from disk when a search touches them.
+
+    Returns:
+        Tuple: (space name -> (ids, matrix), store name -> (ids, offsets, utf-8 blob))
+    """
+    with open(os.path.join(snapshot_path, MANIFEST_FILENAME), 'r') as f:
+        manifest = json.load(f)
+    snapshot_path = os.path.join(snapshot_path, manifest['generation'])
+    spaces = {}
+    for name, info in manifest['spaces'].items():
+        ids = _read_ids(os.path.join(snapshot_path, f'{name}.ids'), info['count'])
+        matrix = _read_array(
+            os.path.join(snapshot_path, f'{name}.vectors'),
+            np.dtype(info['dtype']),
+            (info['count'], info['width']),
+        )
+        spaces[name] = (ids, matrix)
+    documents = {}
+    for name, info in manifest['documents'].items():
+        ids = _read_ids(os.path.join(snapshot_path, f'{name}.ids'), info['count'])
+        offsets = np.fromfile(os.path.join(snapshot_path, f'{name}.offsets'), dtype=np.int64)
+        blob = _read_array(os.path.join(snapshot_path, f'{name}.blob'), np.uint8, (info['size'],))
+        documents[name] = (ids, offsets, blob)
+    return spaces, documents
@@ -0,0 +1,339 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Tuple
+from qdrant_client.conversions.common_types import ScoredPoint
+import numpy as np
+
+# Number of set bits for every possible byte value, used when numpy has no bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount(packed: np.ndarray) -> np.ndarray:
+    """
+    Count set bits of a packed uint8 matrix row by row.
+
+    Args:
+        packed (np.ndarray): uint8 matrix of shape (n, n_bytes)
+
+    Returns:
+        np.ndarray: int32 array of shape (n,) with the number of set bits per row
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(packed).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT_TABLE[packed].sum(axis=1, dtype=np.int32)
+
+def hamming_distances(packed_matrix: np.ndarray, packed_query: np.ndarray) -> np.ndarray:
+    """
+    Hamming distance between a packed query and every row of a packed matrix (XOR + popcount).
+
+    Args:
+        packed_matrix (np.ndarray): uint8 matrix of shape (n, n_bytes)
+        packed_query (np.ndarray): uint8 vector of shape (n_bytes,)
+
+    Returns:
+        np.ndarray: int32 array of shape (n,)
+    """
+    return popcount(np.bitwise_xor(packed_matrix, packed_query))
+
+def top_k_largest(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k largest scores, sorted descending"""
+    return top_k_smallest(-scores, top_k)
+
+def top_k_smallest(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k smallest scores, sorted ascending"""
+    if top_k >= len(scores):
+        return np.argsort(scores, kind='stable')
+    candidates = np.argpartition(scores, top_k)[:top_k]
+    return candidates[np.argsort(scores[candidates], kind='stable')]
+
+
+class MatrixIndex(ABC):
+    """
+    Base class of the brute-force indexes: point ids plus one row per point in a
+    preallocated matrix. The matrix capacity grows geometrically (x2), so appending
+    n points costs O(n) copies in total instead of one full copy per insert.
+
+    Subclasses define the row width/dtype and how raw vectors are converted to rows (_prepare).
+
+    Removing points compacts the matrix into a new one. ids and the matrix are replaced together
+    under a lock, so a search reading them with _snapshot never sees the ids of one and the rows of the other.
+
+    Attributes:
+        ids (List[str]): Point id of each row
+        vectors (np.ndarray): Rows of the points currently in the index
+    """
+    MIN_CAPACITY = 16
+
+    def __init__(self, width: int, dtype):
+        self.ids: List[str] = []
+        self._width = width
+        self._dtype = np.dtype(dtype)
+        self._vectors = np.zeros((0, width), dtype=self._dtype)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self.ids)]
+
+    @property
+    def capacity(self) -> int:
+        return len(self._vectors)
+
+    def _adopt(self, ids: List[str], vectors: np.ndarray) -> None:
+        """Use an existing matrix (e.g. a read-only np.memmap) as storage, it is copied on the first append"""
+        if vectors.shape != (len(ids), self._width):
+            raise ValueError(f"Expected a matrix of shape {(len(ids), self._width)}, got {vectors.shape}")
+        self.ids = list(ids)
+        self._vectors = vectors
+
+    def _snapshot(self) -> Tuple[List[str], np.ndarray]:
+        """Consistent (ids, rows) for a search, still valid if points are added or removed meanwhile"""
+        with self._lock:
+            ids = self.ids
+            return ids, self._vectors[:len(ids)]
+
+    def _reserve(self, size: int) -> None:
+        """Make room for at least size rows, with a single copy of the existing rows"""
+        if size <= self.capacity and self._vectors.flags.writeable:
+            return
+        capacity = max(size, 2 * self.capacity, self.MIN_CAPACITY)
+        grown = np.zeros((capacity, self._width), dtype=self._dtype)
+        n = len(self.ids)
+        grown[:n] = self._vectors[:n]
+        self._vectors = grown
+
+    @abstractmethod
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """Convert a (k, dim) matrix of raw vectors to a (k, width) matrix of rows"""
+
+    def add_points(self, point_ids: List[str], vectors: np.ndarray) -> None:
+        """
+        Append a batch of points.
+
+        Args:
+            point_ids (List[str]): Unique point ids
+            vectors (np.ndarray): Matrix with one vector per point id
+        """
+        if len(point_ids) == 0:
+            return
+        rows = self._prepare(vectors)
+        if len(rows) != len(point_ids):
+            raise ValueError(f"Got {len(point_ids)} point ids for {len(rows)} vectors")
+        with self._lock:
+            n = len(self.ids)
+            self._reserve(n + len(rows))
+            self._vectors[n:n + len(rows)] = rows
+            self.ids.extend(point_ids)
+            self._on_added(n, point_ids)
+
+    def remove_points(self, point_ids: Iterable[str]) -> int:
+        """
+        Remove points and compact the matrix, with one copy of the kept rows.
+
+        Args:
+            point_ids (Iterable[str]): Ids to remove, unknown ids are ignored
+        Returns:
+            int: Number of removed points
+        """
+        removed = set(point_ids)
+        with self._lock:
+            keep = np.fromiter((point_id not in removed for point_id in self.ids), dtype=bool, count=len(self.ids))
+            n_removed = len(self.ids) - int(keep.sum())
+            if n_removed:
+                # New objects rather than in-place edits, a search may still hold the old ones
+                self._vectors = self._vectors[:len(self.ids)][keep]
+                self.ids = [point_id for point_id, kept in zip(self.ids, keep) if kept]
+                self._on_compacted()
+        return n_removed
+
+    def _on_added(self, first_row: int, point_ids: List[str]) -> None:
+        """Called under the lock after add_points appended point_ids from first_row on"""
+
+    def _on_compacted(self) -> None:
+        """Called under the lock after remove_points changed the rows"""
+
+    def add_point(self, point_id: str, vector: np.ndarray) -> None:
+        """Append one point, see add_points"""
+        self.add_points([point_id], np.asarray(vector)[np.newaxis])
+
+
+class BinaryIndex(MatrixIndex):
+    """
+    Brute-force index over binary quantized vectors.
+
+    Vectors are kept packed with np.packbits (768 bits -> 96 bytes per row), so the
+    matrix is 8x smaller than one byte per bit, and scored with vectorized XOR + popcount.
+    The score of a point is its Hamming distance to the query (lower is closer), which
+    is the same ranking the MANHATTAN distance gave on 0/1 vectors.
+
+    Attributes:
+        vector_size (int): Number of bits per vector
+        ids (List[str]): Point id of each row
+        vectors (np.ndarray): uint8 matrix of shape (len(ids), vector_size / 8)
+    """
+    def __init__(self, vector_size: int = 768):
+        if vector_size % 8 != 0:
+            raise ValueError("vector_size must be a multiple of 8")
+        self.vector_size = vector_size
+        self.n_bytes = vector_size // 8
+        super().__init__(width=self.n_bytes, dtype=np.uint8)
+
+    @classmethod
+    def from_arrays(cls, ids: List[str], vectors: np.ndarray, vector_size: int = 768) -> 'BinaryIndex':
+        """Build an index over an existing packed matrix (e.g. a read-only np.memmap) without copying it"""
+        index = cls(vector_size=vector_size)
+        index._adopt(ids, vectors)
+        return index
+
+    def _pack(self, vectors: np.ndarray) -> np.ndarray:
+        """Accept either unpacked 0/1 vectors or already packed ones"""
+        vectors = np.asarray(vectors)
+        if vectors.dtype == np.uint8 and vectors.shape[-1] == self.n_bytes:
+            return vectors
+        if vectors.shape[-1] != self.vector_size:
+            raise ValueError(f"Expected vectors of {self.vector_size} bits, got shape {vectors.shape}")
+        return np.packbits(vectors.astype(np.uint8), axis=-1)
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        return self._pack(vectors)
+
+    def search(self, query_vector: np.ndarray, top_k: int = 16) -> List[ScoredPoint]:
+        """
+        Exhaustive top-k search by Hamming distance.
+
+        Args:
+            query_vector (np.ndarray): Binary quantized query (0/1 values) or packed uint8 vector
+            top_k (int): Number of results
+
+        Returns:
+            List[ScoredPoint]: Results sorted by ascending Hamming distance
+        """
+        ids, vectors = self._snapshot()
+        if len(ids) == 0:
+            return []
+        distances = hamming_distances(vectors, self._pack(query_vector))
+        rows = top_k_smallest(distances, top_k)
+        return [
+            ScoredPoint(id=ids[row], version=0, score=float(distances[row]), payload={}, vector=None)
+            for row in rows
+        ]
+
+
+class DenseIndex(MatrixIndex):
+    """
+    Brute-force cosine index over float32 vectors (used for the image space).
+
+    Rows are L2-normalized on insert, so a search is one matrix-vector product.
+    The score of a point is its cosine similarity to the query (higher is closer).
+
+    Attributes:
+        vector_size (int): Dimension of the vectors
+        ids (List[str]): Point id of each row
+        vectors (np.ndarray): float32 matrix of shape (len(ids), vector_size)
+    """
+    def __init__(self, vector_size: int = 768):
+        self.vector_size = vector_size
+        super().__init__(width=vector_size, dtype=np.float32)
+
+    @classmethod
+    def from_arrays(cls, ids: List[str], vectors: np.ndarray, vector_size: int = 768, normalize: bool = False) -> 'DenseIndex':
+        """
+        Build an index over an existing matrix (e.g. a read-only np.memmap) without copying it.
+        Rows must already be normalized unless normalize is True.
+        """
+        index = cls(vector_size=vector_size)
+        index._adopt(ids, cls._normalize(vectors) if normalize else vectors)
+        return index
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        return self._normalize(np.reshape(vectors, (-1, self.vector_size)))
+
+    def search(self, query_vector: np.ndarray, top_k: int = 8) -> List[ScoredPoint]:
+        """
+        Exhaustive top-k search by cosine similarity.
+
+        Args:
+            query_vector (np.ndarray): float32 query of shape (vector_size,)
+            top_k (int): Number of results
+
+        Returns:
+            List[ScoredPoint]: Results sorted by descending cosine similarity
+        """
+        ids, vectors = self._snapshot()
+        if len(ids) == 0:
+            return []
+        query_vector = self._normalize(np.reshape(query_vector, (self.vector_size,)))
+        similarities = vectors @ query_vector
+        rows = top_k_largest(similarities, top_k)
+        return [
+            ScoredPoint(id=ids[row], version=0, score=float(similarities[row]), payload={}, vector=None)
+            for row in rows
+        ]
+
+
+class RescoreIndex(MatrixIndex):
+    """
+    Higher precision copies (int8, from utils.scalar_quantized) of the text space vectors,
+    used to rescore the candidates of a Hamming search. Only looked up by id, never searched.
+
+    Scores are cosine similarities, so the per-vector scale of scalar quantization does not matter.
+
+    Attributes:
+        vector_size (int): Dimension of the vectors
+        ids (List[str]): Point id of each row
+        vectors (np.ndarray): int8 matrix of shape (len(ids), vector_size)
+    """
+    def __init__(self, vector_size: int = 768):
+        self.vector_size = vector_size
+        self._id_to_row: Dict[str, int] = {}
+        super().__init__(width=vector_size, dtype=np.int8)
+
+    @classmethod
+    def from_arrays(cls, ids: List[str], vectors: np.ndarray, vector_size: int = 768) -> 'RescoreIndex':
+        """Build an index over an existing int8 matrix (e.g. a read-only np.memmap) without copying it"""
+        index = cls(vector_size=vector_size)
+        index._adopt(ids, vectors)
+        index._id_to_row = {point_id: row for row, point_id in enumerate(index.ids)}
+        return index
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors)
+        if vectors.dtype != np.int8:
+            raise ValueError("Rescore vectors must be int8, see utils.scalar_quantized")
+        return np.reshape(vectors, (-1, self.vector_size))
+
+    def _on_added(self, first_row: int, point_ids: List[str]) -> None:
+        for offset, point_id in enumerate(point_ids):
+            self._id_to_row[point_id] = first_row + offset
+
+    def _on_compacted(self) -> None:
+        self._id_to_row = {point_id: row for row, point_id in enumerate(self.ids)}
+
+    def cosine_similarities(self, query_vector: np.ndarray, point_ids: List[str]) -> np.ndarray:
+        """
+        Cosine similarity between a float query and the stored vectors of point_ids.
+
+        Returns:
+            np.ndarray: float32 array aligned with point_ids, NaN where a point has no stored vector
+        """
+        query_vector = np.reshape(np.asarray(query_vector, dtype=np.float32), (self.vector_size,))
+        query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+        scores = np.full(len(point_ids), np.nan, dtype=np.float32)
+        # Rows are looked up under the lock, add_points updates _id_to_row in place
+        with self._lock:
+            positions = [i for i, point_id in enumerate(point_ids) if point_id in self._id_to_row]
+            rows = np.array([self._id_to_row[point_ids[i]] for i in positions], dtype=np.int64)
+            vectors = self._vectors[:len(self.ids)]
+        if positions:
+            candidates = vectors[rows].astype(np.float32)
+            norms = np.maximum(np.linalg.norm(candidates, axis=1), 1e-12)
+            scores[positions] = (candidates @ query_vector) / norms
+        return scores
@@ -0,0 +1,138 @@
+import re
+from typing import FrozenSet, List, Tuple
+from .binary_quantized_rag.document_store import post_id_of
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Characters per token of English text, used when tiktoken is not available
+CHARS_PER_TOKEN = 4
+
+_WHITESPACE = re.compile(r'\s+')
+
+class ContextPacker():
+    """
+    Builds the documents string of a Generator prompt within a token budget.
+
+    Documents are taken in score order (the order of the search results). A text whose content is already
+    contained in a packed text of the same post is dropped, and a text that contains a packed text of its post
+    replaces it. Across posts, a text is a near duplicate of a packed text (e.g. the same story crawled from two
+    sites) when at least near_duplicate_threshold of its word shingles are in the packed text: it is dropped,
+    or replaces the packed text if that one is the near duplicate of it.
+    A document that does not fit in the remaining budget is skipped, so smaller ones further down
+    can still use it. If not even the best document fits, it is truncated to the budget.
+
+    Tokens are counted with tiktoken when it is installed, otherwise approximated as CHARS_PER_TOKEN characters per token.
+
+    Attributes:
+        max_tokens (int): Token budget of the documents string
+        encoding_name (str): tiktoken encoding of the LLM (o200k_base for gpt-4o-mini)
+        shingle_size (int): Number of consecutive words of a shingle
+        near_duplicate_threshold (float): Fraction of the shingles of a text found in another text
+            for it to be a near duplicate of that text
+    """
+    def __init__(
+            self,
+            max_tokens: int = 3000,
+            encoding_name: str = 'o200k_base',
+            shingle_size: int = 3,
+            near_duplicate_threshold: float = 0.8
+        ):
+        self.max_tokens = max_tokens
+        self.encoding_name = encoding_name
+        self.shingle_size = shingle_size
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e: # the encoding is downloaded on first use
+                print(f"WARNING: Cannot load tiktoken encoding {encoding_name}, token counts are approximated: {e}")
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of text with at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self._encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+    def _shingles(self, key: str) -> FrozenSet[Tuple[str, ...]]:
+        """Word shingle_size-grams of a normalized text, the whole text for shorter ones"""
+        words = key.split(' ')
+        if len(words) <= self.shingle_size:
+            return frozenset([tuple(words)])
+        return frozenset(tuple(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1))
+
+    def _is_near_duplicate(self, shingles: FrozenSet, other: FrozenSet) -> bool:
+        """Whether the text of shingles is a near duplicate of the text of other"""
+        return len(shingles & other) >= self.near_duplicate_threshold * len(shingles)
+
+    def _format(self, documents: List[str]) -> str:
+        return "".join(f"Document {i}:\n{document}\n\n" for i, document in enumerate(documents))
+
+    def pack(self, documents: List[str], point_ids: List[str] | None = None) -> str:
+        """
+        Args:
+            documents (List[str]): Retrieved texts or metadatas, best first
+            point_ids (List[str] | None): Point id of each document, enables the deduplication per post
+        Returns:
+            str: 'Document i:' blocks of the packed documents, in score order
+        """
+        if point_ids is None:
+            point_ids = [str(i) for i in range(len(documents))]
+        packed: List[str] = []
+        packed_keys: List[str] = [] # normalized text, for containment checks
+        packed_shingles: List[FrozenSet] = [] # for near duplicate checks
+        packed_posts: List[str] = []
+        packed_tokens: List[int] = []
+        for document, point_id in zip(documents, point_ids):
+            if not document:
+                continue
+            post_id = post_id_of(point_id)
+            key = _WHITESPACE.sub(' ', document).strip().lower()
+            shingles = self._shingles(key)
+            tokens = self.count_tokens(f"Document {len(packed)}:\n{document}\n\n")
+            if any(
+                (packed_posts[i] == post_id and key in packed_keys[i])
+                or self._is_near_duplicate(shingles, packed_shingles[i])
+                for i in range(len(packed))
+            ):
+                continue
+            contained = [
+                i for i in range(len(packed))
+                if (packed_posts[i] == post_id and packed_keys[i] in key)
+                or self._is_near_duplicate(packed_shingles[i], shingles)
+            ]
+            if contained:
+                # Replace the first contained text with this one, drop the others
+                freed = sum(packed_tokens[i] for i in contained)
+                if sum(packed_tokens) - freed + tokens > self.max_tokens:
+                    continue
+                first = contained[0]
+                packed[first], packed_keys[first], packed_shingles[first] = document, key, shingles
+                packed_posts[first], packed_tokens[first] = post_id, tokens
+                for i in reversed(contained[1:]):
+                    del packed[i], packed_keys[i], packed_shingles[i], packed_posts[i], packed_tokens[i]
+                continue
+            if sum(packed_tokens) + tokens > self.max_tokens:
+                if not packed:
+                    # Even the best document is too long, keep its beginning
+                    document = self.truncate(document, self.max_tokens - self.count_tokens(f"Document 0:\n\n\n"))
+                    packed, packed_keys, packed_posts, packed_tokens = [document], [key], [post_id], [self.max_tokens]
+                    packed_shingles = [shingles]
+                continue
+            packed.append(document)
+            packed_keys.append(key)
+            packed_shingles.append(shingles)
+            packed_posts.append(post_id)
+            packed_tokens.append(tokens)
+        return self._format(packed)
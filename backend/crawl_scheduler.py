@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Tuple
+from .query_embedding_cache import normalize_query
+
+class CrawlQueueFull(Exception):
+    """Raised by CrawlScheduler.submit when max_queued crawls are already waiting"""
+
+
+class CrawlScheduler():
+    """
+    Application-wide scheduler of internet searches (crawls).
+
+    Crawls run in one long-lived pool of max_workers threads, so concurrent queries never start
+    more than max_workers crawls (and their Chrome instances) at once. Identical search queries
+    (after normalize_query) share the crawl already in flight instead of starting another one.
+    At most max_queued crawls wait behind the running ones, beyond that submit raises CrawlQueueFull.
+
+    Attributes:
+        crawl_fn (Callable[[str], Any]): Blocking crawl of one search query
+        max_workers (int): Number of crawls running at once
+        max_queued (int): Number of crawls allowed to wait for a worker
+    """
+    def __init__(self, crawl_fn: Callable[[str], Any], max_workers: int = 2, max_queued: int = 8):
+        self.crawl_fn = crawl_fn
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crawl')
+        # Crawls not finished yet, in submission order (the executor is FIFO, so the first max_workers are running)
+        self._in_flight: OrderedDict[str, Future] = OrderedDict()
+        # Reentrant: a done callback runs in the submitting thread when the crawl already finished
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    def submit(self, search_query: str) -> Tuple[Future, int]:
+        """
+        Start a crawl of search_query, or join the identical one in flight.
+
+        Returns:
+            Tuple[Future, int]: future of the crawl result, and the number of crawls that must
+            finish before it gets a worker (0 if it is running)
+        Raises:
+            CrawlQueueFull: Too many crawls are already waiting
+        """
+        key = normalize_query(search_query)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                if len(self._in_flight) >= self.max_workers + self.max_queued:
+                    raise CrawlQueueFull(f"{len(self._in_flight)} internet searches are already scheduled")
+                future = self.executor.submit(self.crawl_fn, search_query)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda done, key=key: self._finish(key, done))
+            return future, self._queue_position(key)
+
+    def _queue_position(self, key: str) -> int:
+        if key not in self._in_flight:
+            return 0
+        index = list(self._in_flight).index(key)
+        return max(0, index - self.max_workers + 1)
+
+    def _finish(self, key: str, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
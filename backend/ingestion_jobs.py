@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+class IngestionQueueFull(Exception):
+    """Raised by IngestionJobManager.submit when max_queued documents are already waiting"""
+
+
+class IngestionJob():
+    """
+    Progress of the ingestion of one uploaded document, updated by the worker and read by the progress endpoint.
+
+    Attributes:
+        id (str): Job id returned to the client
+        filename (str): Name of the uploaded file
+        path (str): Where the upload was written
+        content_hash (str): sha256 of the file content
+        state (str): One of IngestionJob.STATES
+        post_id (str | None): Id of the indexed document (the original one for a duplicate)
+        duplicate_of (str | None): Job id of the original of a duplicate uploaded while the original was
+            being ingested, the duplicate stays queued until the original is finished
+        pages_total (int), pages_parsed (int): Pages of a pdf, 0 for other formats
+        chunks_embedded (int): Chunks chunked and embedded so far
+        points_indexed (int): Chunks added to the text space so far
+        error (str | None): Why the job failed
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    DUPLICATE = 'duplicate'
+    STATES = (QUEUED, RUNNING, DONE, FAILED, DUPLICATE)
+
+    def __init__(self, filename: str, path: str, content_hash: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.content_hash = content_hash
+        self.state = IngestionJob.QUEUED
+        self.post_id = None
+        self.duplicate_of = None
+        self.pages_total = 0
+        self.pages_parsed = 0
+        self.chunks_embedded = 0
+        self.points_indexed = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (IngestionJob.DONE, IngestionJob.FAILED, IngestionJob.DUPLICATE)
+
+    def set_pages(self, pages_parsed: int, pages_total: int) -> None:
+        self.pages_parsed = pages_parsed
+        self.pages_total = pages_total
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "state": self.state,
+            "post_id": self.post_id,
+            "duplicate_of": self.duplicate_of,
+            "pages_total": self.pages_total,
+            "pages_parsed": self.pages_parsed,
+            "chunks_embedded": self.chunks_embedded,
+            "points_indexed": self.points_indexed,
+            "error": self.error,
+        }
+
+
+class IngestionJobManager():
+    """
+    Runs the ingestion of uploaded documents in a bounded pool of background workers.
+
+    Conversion and embedding are CPU bound (torch already uses every core), so by default a single
+    document is ingested at a time and at most max_queued wait behind it, beyond that submit raises
+    IngestionQueueFull. A document whose content hash was already ingested is not ingested again: its
+    job is DUPLICATE and points to the original post. A document whose content hash is being ingested
+    waits for the original job: it becomes DUPLICATE if the original is DONE, and is ingested in place
+    of the original if the original FAILED.
+    Hashes of ingested documents are saved to hashes_path, so re-uploads are skipped across restarts,
+    as long as post_exists confirms their post is still indexed (otherwise the hash is forgotten and the
+    document ingested again).
+
+    Attributes:
+        ingest_fn (Callable[[str, IngestionJob], str | None]): Blocking ingestion of a file,
+            updates the progress of the job and returns the post id, None on failure
+        max_workers (int): Number of documents ingested at once
+        max_queued (int): Number of documents allowed to wait for a worker
+        max_finished (int): Finished jobs kept for the progress endpoint
+        hashes_path (str | None): json of {content hash: post id} of the ingested documents
+        upload_dir (str): Directory of the uploads, see upload_path
+        post_exists (Callable[[str], bool] | None): Whether a post id is still indexed, None to trust the saved hashes
+    """
+    def __init__(
+            self,
+            ingest_fn: Callable[[str, IngestionJob], str | None],
+            max_workers: int = 1,
+            max_queued: int = 16,
+            max_finished: int = 256,
+            hashes_path: str | None = None,
+            upload_dir: str = 'uploads',
+            post_exists: Callable[[str], bool] | None = None
+        ):
+        self.ingest_fn = ingest_fn
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.hashes_path = hashes_path
+        self.upload_dir = upload_dir
+        self.post_exists = post_exists
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingestion')
+        self._jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        self._in_flight: Dict[str, IngestionJob] = {} # content hash -> job not finished yet
+        self._waiting: Dict[str, List[IngestionJob]] = {} # content hash -> duplicates waiting for the in-flight job
+        self._ingested: Dict[str, str] = self._load_hashes() # content hash -> post id
+        self._lock = threading.Lock()
+
+    def _load_hashes(self) -> Dict[str, str]:
+        if self.hashes_path is None or not os.path.exists(self.hashes_path):
+            return {}
+        try:
+            with open(self.hashes_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"WARNING: Cannot load ingested document hashes from {self.hashes_path}: {e}")
+            return {}
+
+    def _save_hashes(self) -> None:
+        if self.hashes_path is None:
+            return
+        tmp_path = self.hashes_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._ingested, f)
+        os.replace(tmp_path, self.hashes_path)
+
+    def submit(self, filename: str, path: str, content_hash: str) -> IngestionJob:
+        """
+        Schedule the ingestion of an uploaded file, or record it as a duplicate.
+
+        Args:
+            filename (str): Name of the uploaded file
+            path (str): Where the upload was written (see upload_path), removed once the job is finished
+            content_hash (str): sha256 of the file content
+        Returns:
+            IngestionJob: The new job, already finished if it is a duplicate of an ingested document
+        Raises:
+            IngestionQueueFull: Too many documents are already waiting
+        """
+        job = IngestionJob(filename, path, content_hash)
+        with self._lock:
+            self._forget_if_removed(content_hash)
+            if content_hash in self._ingested:
+                job.post_id = self._ingested[content_hash]
+                self._finish(job, IngestionJob.DUPLICATE)
+                self._add(job)
+                return job
+            original = self._in_flight.get(content_hash)
+            if original is not None:
+                # Resolved when the original is finished, see _run
+                job.post_id, job.duplicate_of = original.post_id, original.id
+                self._waiting.setdefault(content_hash, []).append(job)
+                self._add(job)
+                return job
+            if len(self._in_flight) >= self.max_workers + self.max_queued:
+                self._remove_upload(job)
+                raise IngestionQueueFull(f"{len(self._in_flight)} documents are already being ingested")
+            self._in_flight[content_hash] = job
+            self._add(job)
+        self.executor.submit(self._run, job)
+        return job
+
+    def _forget_if_removed(self, content_hash: str) -> None:
+        """Forget an ingested hash whose post was deleted or not indexed anymore (e.g. after a rebuild)"""
+        post_id = self._ingested.get(content_hash)
+        if post_id is None or self.post_exists is None or self.post_exists(post_id):
+            return
+        print(f"WARNING: {post_id} is not indexed anymore, ingesting its document again")
+        del self._ingested[content_hash]
+        try:
+            self._save_hashes()
+        except Exception as e:
+            print(f"WARNING: Cannot save ingested document hashes to {self.hashes_path}: {e}")
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    def _add(self, job: IngestionJob) -> None:
+        self._jobs[job.id] = job
+        # Forget the oldest finished jobs
+        finished = [job_id for job_id, other in self._jobs.items() if other.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: IngestionJob) -> None:
+        job.state = IngestionJob.RUNNING
+        post_id = None
+        try:
+            post_id = self.ingest_fn(job.path, job)
+            if post_id is None:
+                job.error = job.error or "Cannot convert the document"
+        except Exception as e:
+            print(f"ERROR: Cannot ingest {job.filename}: {e}")
+            job.error = str(e)
+        with self._lock:
+            del self._in_flight[job.content_hash]
+            waiting = self._waiting.pop(job.content_hash, [])
+            if post_id is not None:
+                job.post_id = post_id
+                self._ingested[job.content_hash] = post_id
+                try:
+                    self._save_hashes()
+                except Exception as e:
+                    print(f"WARNING: Cannot save ingested document hashes to {self.hashes_path}: {e}")
+                for duplicate in waiting:
+                    duplicate.post_id = post_id
+                    self._finish(duplicate, IngestionJob.DUPLICATE)
+            elif waiting:
+                # Ingest the first duplicate instead, the others now wait for it
+                retry, waiting = waiting[0], waiting[1:]
+                retry.post_id, retry.duplicate_of = None, None
+                self._in_flight[job.content_hash] = retry
+                for duplicate in waiting:
+                    duplicate.duplicate_of = retry.id
+                if waiting:
+                    self._waiting[job.content_hash] = waiting
+                self.executor.submit(self._run, retry)
+            self._finish(job, IngestionJob.DONE if post_id is not None else IngestionJob.FAILED)
+
+    def _finish(self, job: IngestionJob, state: str) -> None:
+        job.state = state
+        job.finished_at = time.time()
+        self._remove_upload(job)
+
+    def upload_path(self, filename: str) -> str:
+        """Path to write an upload to, in a directory of its own so uploads of the same name never collide"""
+        directory = os.path.join(self.upload_dir, uuid.uuid4().hex)
+        os.makedirs(directory)
+        return os.path.join(directory, os.path.basename(filename))
+
+    def _remove_upload(self, job: IngestionJob) -> None:
+        # ingest_fn removes the file of a successful ingestion
+        self.remove_upload(job.path)
+
+    def remove_upload(self, path: str) -> None:
+        """Remove an upload and its directory (see upload_path), e.g. when it could not be written completely"""
+        if os.path.exists(path):
+            os.remove(path)
+        directory = os.path.dirname(path)
+        if os.path.abspath(directory) != os.path.abspath(self.upload_dir):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable
+
+# Weight files counted to estimate the size of a model that is not loaded yet
+WEIGHT_EXTENSIONS = ('.safetensors', '.bin', '.pt', '.onnx', '.gguf')
+
+def _directory_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return 0
+    return sum(
+        entry.stat().st_size
+        for entry in os.scandir(path)
+        if entry.is_file() and entry.name.endswith(WEIGHT_EXTENSIONS)
+    )
+
+def _parameters_size(model: Any) -> int:
+    """Bytes of the parameters and buffers of a torch module, 0 for anything else"""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+    except AttributeError:
+        return 0
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class RegisteredModel():
+    """
+    Attributes:
+        name (str): Display name
+        path (str): Directory of the weights
+        users (int): Number of components that asked for the model
+        value (Any): Whatever the loader returned, None until the first use
+        size (int): Bytes of the loaded weights, or of the weight files while not loaded
+        load_seconds (float): Time the loader took
+        lock (threading.Lock): Held by users around every call of the model, which is shared between threads
+            (e.g. a fast tokenizer raises "Already borrowed" when called from two threads at once)
+    """
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.users = 0
+        self.value = None
+        self.size = _directory_size(path)
+        self.load_seconds = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.value is not None
+
+
+class ModelRegistry():
+    """
+    Process-wide registry of model weights, so every component shares one copy of each model.
+
+    Components register the model they use when they are built (cheap, nothing is loaded) and call get
+    on first use, which runs the loader once. report() prints how many components share each model and
+    the memory this saves compared to one copy per component.
+    """
+    def __init__(self):
+        self._models: Dict[Hashable, RegisteredModel] = {}
+        self._lock = threading.RLock()
+
+    def register(self, key: Hashable, name: str, path: str) -> None:
+        """Declare one more user of a model"""
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = RegisteredModel(name, path)
+            self._models[key].users += 1
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the loaded model, running loader if this is the first use"""
+        model = self._models[key]
+        if model.value is None:
+            with self._lock:
+                if model.value is None:
+                    print(f"Loading {model.name} from {model.path}")
+                    start = time.perf_counter()
+                    value = loader()
+                    model.load_seconds = time.perf_counter() - start
+                    parameters_size = sum(_parameters_size(part) for part in (value if isinstance(value, tuple) else (value,)))
+                    model.size = parameters_size or model.size
+                    model.value = value
+        return model.value
+
+    def lock(self, key: Hashable) -> threading.Lock:
+        """Lock serializing the calls of a registered model"""
+        return self._models[key].lock
+
+    def report(self) -> None:
+        """Print each model, its users and the memory saved by sharing it"""
+        saved = 0
+        print(f"Model registry: {len(self._models)} models, {sum(m.users for m in self._models.values())} users")
+        for model in self._models.values():
+            model_saved = (model.users - 1) * model.size
+            saved += model_saved
+            state = f"loaded in {model.load_seconds:.1f}s" if model.loaded else "not loaded yet"
+            print(f"  {model.name}: {model.users} users, {model.size / 2**20:.1f} MB, {state}, {model_saved / 2**20:.1f} MB saved")
+        print(f"  Total saved by sharing: {saved / 2**20:.1f} MB")
+
+
+# Registry shared by the whole process
+model_registry = ModelRegistry()
@@ -1,3 +1,3 @@
 from .retriever import Retriever
 from .naive_rag import NaiveRAG
-from .generator import Generator
+from .generator import Generator, DeltaRelay, NOT_INFORMATIVE
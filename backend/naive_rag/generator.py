@@ -1,31 +1,58 @@
-from openai import OpenAI
+from contextlib import aclosing
+from openai import OpenAI, AsyncOpenAI
 
-from typing import List
+from typing import AsyncIterator, Callable, List
 from llama_index.core.schema import Document as LLamaDocument
 
+# Answer of check_informative when the documents do not answer the query
+NOT_INFORMATIVE = 'False'
+
 class Generator():
+    """
+    OpenAI LLM. Every call has a blocking version (for begin and scripts) and an async
+    version (prefixed with 'a', for the API) that does not block the event loop.
+    """
     def __init__(self) -> None:
         self.model = OpenAI()
+        self.async_model = AsyncOpenAI()
+
+    def _generate_messages(self, user_query:str, documents_str:str) -> List[dict]:
+        return [
+            {"role": "system", 
+             "content": """You are an assistant for question-answering tasks.
+                The user will provide their query and documents which is crawled from newspaper.
+                Use the provided documents to answer the question.
+                If the document does not provide enough information, please say the document does not provide enough information.
+            """
+            },
+            {
+                "role": "user",
+                "content": f"User query: {user_query}\nDocuments:\n{documents_str}"
+            }
+        ]
+
+    def _check_informative_messages(self, user_query:str, documents_str:str) -> List[dict]:
+        return [
+            {"role": "system", 
+             "content": """You are an assistant for question-answering tasks.
+                The user will provide their query and documents which is crawled from newspaper.
+                Use the provided documents to answer user question.
+                If the document does not provide enough information, please response with a single word 'False'.
+            """
+            },
+            {
+                "role": "user",
+                "content": f"Query: {user_query}\nDocuments:\n{documents_str}"
+            }
+        ]
 
     def generate(self, user_query:str ,documents_str:str) -> str:
         completion = self.model.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", 
-                 "content": """You are an assistant for question-answering tasks.
-                    The user will provide their query and documents which is crawled from newspaper.
-                    Use the provided documents to answer the question.
-                    If the document does not provide enough information, please say the document does not provide enough information.
-                """
-                },
-                {
-                    "role": "user",
-                    "content": f"User query: {user_query}\nDocuments:\n{documents_str}"
-                }
-            ]
+            messages=self._generate_messages(user_query, documents_str)
         )
         return completion.choices[0].message.content
-    
+
     def check_informative(self,user_query:str,documents_str:str) -> str:
         """Function to check if documents satisfy user's query
         
@@ -40,18 +67,71 @@ class Generator():
         """
         completion = self.model.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", 
-                 "content": """You are an assistant for question-answering tasks.
-                    The user will provide their query and documents which is crawled from newspaper.
-                    Use the provided documents to answer user question.
-                    If the document does not provide enough information, please response with a single word 'False'.
-                """
-                },
-                {
-                    "role": "user",
-                    "content": f"Query: {user_query}\nDocuments:\n{documents_str}"
-                }
-            ]
+            messages=self._check_informative_messages(user_query, documents_str)
+        )
+        return completion.choices[0].message.content
+
+    async def _astream(self, messages: List[dict]) -> AsyncIterator[str]:
+        stream = await self.async_model.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            stream=True
         )
-        return completion.choices[0].message.content
\ No newline at end of file
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    async def astream_generate(self, user_query:str, documents_str:str) -> AsyncIterator[str]:
+        """Streaming version of generate, yields the answer piece by piece"""
+        async with aclosing(self._astream(self._generate_messages(user_query, documents_str))) as stream:
+            async for delta in stream:
+                yield delta
+
+    async def astream_check_informative(self, user_query:str, documents_str:str) -> AsyncIterator[str]:
+        """
+        Streaming version of check_informative, yields the answer piece by piece.
+        Yields nothing if the documents are not informative: the first tokens are held back while
+        they could still spell 'False', and the stream is closed as soon as they do.
+        """
+        held = ""
+        verdict_known = False
+        # aclosing closes the HTTP stream as soon as we return, not when the generator is garbage collected
+        async with aclosing(self._astream(self._check_informative_messages(user_query, documents_str))) as stream:
+            async for delta in stream:
+                if verdict_known:
+                    yield delta
+                    continue
+                held += delta
+                if held.strip() == NOT_INFORMATIVE:
+                    return
+                if not NOT_INFORMATIVE.startswith(held.lstrip()):
+                    verdict_known = True
+                    yield held
+        if not verdict_known and held.strip() and held.strip() != NOT_INFORMATIVE:
+            yield held
+
+
+class DeltaRelay():
+    """
+    Forwards the deltas of a streamed answer to a sink, or holds them until a sink is attached.
+    Lets a speculative answer be generated in the background and shown only if it is chosen.
+    """
+    def __init__(self, sink: Callable[[str], None] | None = None):
+        self._sink = sink
+        self._held: List[str] = []
+
+    def __call__(self, delta: str) -> None:
+        if self._sink is None:
+            self._held.append(delta)
+        else:
+            self._sink(delta)
+
+    def attach(self, sink: Callable[[str], None]) -> None:
+        """Send the held deltas to sink, then forward the next ones as they come"""
+        for delta in self._held:
+            sink(delta)
+        self._held.clear()
+        self._sink = sink
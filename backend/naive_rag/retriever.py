@@ -99,7 +99,8 @@ class Retriever():
         """Chunk a list of LlamaDocument to a list of TextNode with Semantic chunking method"""
         semantic_chunker = SemanticChunker(
             breakpoint_percentile_threshold=60,
-            include_metadata=False
+            include_metadata=False,
+            embed_chunks=True
         )
         nodes = semantic_chunker.chunk_nodes_from_documents(documents=documents)
         return nodes
@@ -114,6 +115,8 @@ class Retriever():
             - The same List[TextNode] but with embeddings
         """
         for i,node in enumerate(nodes):
+            if node.embedding is not None: # already embedded by the chunker
+                continue
             print(f"embedding {i}th node")
             embedding = self.embed_model._get_text_embedding(node.text)
             node.embedding = embedding
@@ -3,13 +3,16 @@ from llama_index.core.base.embeddings.base import Embedding
 from llama_index.core.embeddings import BaseEmbedding
 from sentence_transformers import SentenceTransformer
 from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.utils import get_tqdm_iterable
 from gpt4all import Embed4All
 from transformers import AutoTokenizer, AutoModel, AutoImageProcessor
 import torch.nn.functional as F
 import torch
+import os
 import numpy as np
+from .model_registry import model_registry
 
-from typing import List
+from typing import List, Tuple
 
 class NomicEmbed(BaseEmbedding):
     """ Code to download model
@@ -27,49 +30,159 @@ class NomicEmbed(BaseEmbedding):
     work with this lib components. See BaseEmbedding class
 
     Attribute:
-        _tokenizer (AutoTokenizer):
-        _text_model (AUtoModel):
+        _model_path (str): Directory of the weights. Tokenizer and model are loaded on first use
+            and shared through the model registry by every NomicEmbed of the same path and backend
+            (and onnx_threads for 'onnx', the session is created with its thread count).
+        _backend (str): Inference backend, one of BACKENDS:
+            'torch'      fp32 PyTorch model
+            'torch-int8' PyTorch model with the Linear layers dynamically quantized to int8
+            'onnx'       ONNX export of the model (written once to <model_path>/onnx/model.onnx)
+                         run by onnxruntime with onnx_threads intra-op threads, needs the onnxruntime package
 
     Methods:
         Well, the function names are self-explained. :)
     """
-    _tokenizer = PrivateAttr()
-    _text_model = PrivateAttr()
-    def __init__(self,model_path:str='./resources/models/nomic-embed-text-v1.5',**kwargs:Any):
-        super().__init__(**kwargs)
-        self._tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self._text_model = AutoModel.from_pretrained(model_path, trust_remote_code=True)
-        self._text_model.eval()
+    BACKENDS = ('torch', 'torch-int8', 'onnx')
+    _model_path:str = PrivateAttr()
+    _backend:str = PrivateAttr()
+    _onnx_threads:int = PrivateAttr()
+    def __init__(
+            self,
+            model_path:str='./resources/models/nomic-embed-text-v1.5',
+            embed_batch_size:int=32,
+            backend:str='torch',
+            onnx_threads:int|None=None,
+            **kwargs:Any
+        ):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {self.BACKENDS}")
+        super().__init__(embed_batch_size=embed_batch_size, **kwargs)
+        self._model_path = model_path
+        self._backend = backend
+        self._onnx_threads = onnx_threads or os.cpu_count() or 1
+        model_registry.register(self._registry_key, f'nomic-embed-text ({backend})', model_path)
+
+    @property
+    def _registry_key(self) -> Tuple[str, str, str, int | None]:
+        onnx_threads = self._onnx_threads if self._backend == 'onnx' else None
+        return ('nomic-embed-text', self._model_path, self._backend, onnx_threads)
+
+    def _load_model(self) -> Tuple[Any, Any]:
+        tokenizer = AutoTokenizer.from_pretrained(self._model_path)
+        text_model = AutoModel.from_pretrained(self._model_path, trust_remote_code=True)
+        text_model.eval()
+        if self._backend == 'torch-int8':
+            text_model = torch.quantization.quantize_dynamic(text_model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif self._backend == 'onnx':
+            text_model = self._load_onnx_session(tokenizer, text_model)
+        return tokenizer, text_model
+
+    def _load_onnx_session(self, tokenizer, text_model) -> Any:
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError(
+                "`onnxruntime` package not found, "
+                "please run `pip install onnxruntime` or use backend='torch'"
+            )
+        onnx_path = os.path.join(self._model_path, 'onnx', 'model.onnx')
+        if not os.path.exists(onnx_path):
+            self._export_onnx(tokenizer, text_model, onnx_path)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self._onnx_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return onnxruntime.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+    def _export_onnx(self, tokenizer, text_model, onnx_path:str) -> None:
+        """Export the token embeddings (last hidden state) with dynamic batch and sequence axes"""
+        sample = tokenizer(['search_document: export', 'search_document: a longer export sample'], padding=True, return_tensors='pt')
+        input_names = list(sample.keys())
+
+        class LastHiddenState(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(input_names, inputs)))[0]
+
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+        with torch.no_grad():
+            torch.onnx.export(
+                LastHiddenState(text_model),
+                tuple(sample[name] for name in input_names),
+                onnx_path + '.tmp',
+                input_names=input_names,
+                output_names=['last_hidden_state'],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+            )
+        os.replace(onnx_path + '.tmp', onnx_path)
+
+    def load(self) -> Tuple[Any, Any]:
+        """(tokenizer, model), loaded on the first call of any NomicEmbed of this model path and backend"""
+        return model_registry.get(self._registry_key, self._load_model)
+
+    def _forward(self, text_model, encoded_input) -> Tuple[torch.Tensor]:
+        """Token embeddings of the backend, as the first element of a tuple like a transformers output"""
+        if self._backend == 'onnx':
+            feeds = {i.name: encoded_input[i.name].numpy() for i in text_model.get_inputs()}
+            return (torch.from_numpy(text_model.run(None, feeds)[0]),)
+        return text_model(**encoded_input)
 
     def mean_pooling(self,model_output, attention_mask):
         token_embeddings = model_output[0]
         input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
         return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
+
+    def _embed(self, texts:List[str], matryoshka_dim:int|None=None) -> np.ndarray:
+        """Embed texts in a single forward pass, padded to the longest text. Returns (len(texts), dim)"""
+        tokenizer, text_model = self.load()
+        # Tokenizer and model are shared by every NomicEmbed of the process, and called from several threads
+        with model_registry.lock(self._registry_key), torch.inference_mode():
+            encoded_input = tokenizer(texts, padding=True, truncation=True, return_tensors='pt')
+            model_output = self._forward(text_model, encoded_input)
+            text_embeddings = self.mean_pooling(model_output, encoded_input['attention_mask'])
+            text_embeddings = F.layer_norm(text_embeddings, normalized_shape=(text_embeddings.shape[1],))
+            if matryoshka_dim is not None:
+                text_embeddings = text_embeddings[:, :matryoshka_dim]
+            text_embeddings = F.normalize(text_embeddings, p=2, dim=1)
+        return text_embeddings.numpy()
     
     def _get_embeddings_for_image_query(self,text:str) -> np.ndarray:
         """Text is directly embed without prefix"""
-        encoded_input = self._tokenizer([text], padding=True, truncation=True, return_tensors='pt')
-        with torch.no_grad():
-            model_output = self._text_model(**encoded_input)
-        text_embeddings = self.mean_pooling(model_output, encoded_input['attention_mask'])
-        text_embeddings = F.layer_norm(text_embeddings, normalized_shape=(text_embeddings.shape[1],))
-        text_embeddings = F.normalize(text_embeddings, p=2, dim=1)
-        text_embeddings = text_embeddings.detach().numpy()
-        text_embeddings = text_embeddings[0]
-        return text_embeddings
+        return self._embed([text])[0]
 
     def _get_text_embedding(self, text:str) -> np.ndarray:
-        encoded_input = self._tokenizer([text], padding=True, truncation=True, return_tensors='pt')
-        matryoshka_dim = 768
-        with torch.no_grad():
-            model_output = self._text_model(**encoded_input)
-        text_embeddings = self.mean_pooling(model_output, encoded_input['attention_mask'])
-        text_embeddings = F.layer_norm(text_embeddings, normalized_shape=(text_embeddings.shape[1],))
-        text_embeddings = text_embeddings[:, :matryoshka_dim]
-        text_embeddings = F.normalize(text_embeddings, p=2, dim=1)
-        text_embeddings = text_embeddings.detach().numpy()
-        text_embeddings = text_embeddings[0]
-        return text_embeddings
+        return self._embed([text], matryoshka_dim=768)[0]
+
+    def _get_text_embeddings(self, texts:List[str]) -> List[np.ndarray]:
+        """
+        Batch version of _get_text_embedding.
+        Texts are sorted by length and embedded embed_batch_size at a time, so each
+        forward pass pads to similar lengths instead of to the longest text of the input.
+        """
+        return self._embed_length_bucketed(texts)
+
+    def get_text_embedding_batch(self, texts:List[str], show_progress:bool=False, **kwargs:Any) -> List[np.ndarray]:
+        """
+        Overrides BaseEmbedding.get_text_embedding_batch, which splits the input into chunks of
+        embed_batch_size before calling _get_text_embeddings, so length bucketing sees all texts.
+        """
+        return self._embed_length_bucketed(texts, show_progress=show_progress)
+
+    def _embed_length_bucketed(self, texts:List[str], show_progress:bool=False) -> List[np.ndarray]:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[start:start + self.embed_batch_size] for start in range(0, len(order), self.embed_batch_size)]
+        embeddings: List[np.ndarray] = [None] * len(texts)
+        for batch in get_tqdm_iterable(batches, show_progress, "Generating embeddings"):
+            batch_embeddings = self._embed([texts[i] for i in batch], matryoshka_dim=768)
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+        return embeddings
 
     async def _aget_text_embedding(self, text:str)-> np.ndarray:
         embeddings = await self._get_text_embedding(text)
@@ -77,16 +190,7 @@ class NomicEmbed(BaseEmbedding):
     
     def _get_query_embedding(self, query: str)-> np.ndarray:
         """dont use"""
-        query = 'search_query: ' + query
-        encoded_input = self._tokenizer([query], padding=True, truncation=True, return_tensors='pt')
-        with torch.no_grad():
-            model_output = self._text_model(**encoded_input)
-        text_embeddings = self.mean_pooling(model_output, encoded_input['attention_mask'])
-        text_embeddings = F.layer_norm(text_embeddings, normalized_shape=(text_embeddings.shape[1],))
-        text_embeddings = F.normalize(text_embeddings, p=2, dim=1)
-        text_embeddings = text_embeddings.detach().numpy()
-        text_embeddings = text_embeddings[0]
-        return text_embeddings
+        return self._embed(['search_query: ' + query])[0]
     
     async def _aget_query_embedding(self, query: str)-> np.ndarray:
         embeddings = await self._get_query_embedding(query)
@@ -1,12 +1,17 @@
 
+import io
 import numpy as np
+import torch
 import torch.nn.functional as F
+from concurrent.futures import ThreadPoolExecutor
 from transformers import AutoModel, AutoImageProcessor
 from PIL import Image, ImageFile
 import requests
-from typing import Any
+from requests.adapters import HTTPAdapter
+from typing import Any, List, Tuple
 from llama_index.core.bridge.pydantic import PrivateAttr
 from gpt4all import Embed4All
+from .model_registry import model_registry
 
 MODEL_PATH = "./resources/models/nomic-embed-vision-v1.5"
 
@@ -29,29 +34,96 @@ class NomicEmbedVision():
         The pre-trained model used for embedding images.
     _processor : Any
         The processor used to preprocess images before embedding.
+    Both are loaded on first use and shared through the model registry by every
+    NomicEmbedVision of the same paths. Forward passes hold the registry lock of the model.
     Methods
     -------
     __init__(model_path: str = MODEL_PATH, processor_path: str = MODEL_PATH)
         Initializes the NomicEmbededVison with a pre-trained model and processor.
     embed_image(url: str) -> torch.Tensor
         Embeds an image from a given URL and returns the embedding as a torch.Tensor.
+    embed_images(urls: List[str]) -> List[np.ndarray | None]
+        Embeds images from many URLs, downloaded concurrently and embedded in batches.
     """
-    _model: Any = PrivateAttr()
-    _processor: Any = PrivateAttr()
+    def __init__(self, model_path: str = MODEL_PATH, processor_path: str = MODEL_PATH, max_workers: int = 8):
+        self.model_path = model_path
+        self.processor_path = processor_path
+        self._registry_key = ('nomic-embed-vision', model_path, processor_path)
+        model_registry.register(self._registry_key, 'nomic-embed-vision', model_path)
+        self.max_workers = max_workers
+        # Pooled keep-alive connections, images of a post usually come from the same CDN host
+        self._session = requests.Session()
+        self._session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=max_workers))
+        self._session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=max_workers))
 
-    def __init__(self, model_path: str = MODEL_PATH, processor_path: str = MODEL_PATH):
-        self._processor = AutoImageProcessor.from_pretrained(processor_path)
-        self._model = AutoModel.from_pretrained(model_path, trust_remote_code=True)
+    def _load_model(self) -> Tuple[Any, Any]:
+        processor = AutoImageProcessor.from_pretrained(self.processor_path)
+        model = AutoModel.from_pretrained(self.model_path, trust_remote_code=True)
+        model.eval()
+        return processor, model
+
+    @property
+    def _processor(self) -> Any:
+        return model_registry.get(self._registry_key, self._load_model)[0]
+
+    @property
+    def _model(self) -> Any:
+        return model_registry.get(self._registry_key, self._load_model)[1]
 
     def embed_image(self, url: str) -> np.ndarray: 
         image = Image.open(requests.get(url, stream=True).raw)
         inputs = self._processor(image, return_tensors="pt")
-        img_emb = self._model(**inputs).last_hidden_state
-        img_embeddings = F.normalize(img_emb[:, 0], p=2, dim=1)
-        return img_embeddings.detach().numpy()
+        model = self._model
+        with model_registry.lock(self._registry_key), torch.inference_mode():
+            img_emb = model(**inputs).last_hidden_state
+            img_embeddings = F.normalize(img_emb[:, 0], p=2, dim=1)
+        return img_embeddings.numpy()
+
+    def _load_pixels(self, url: str) -> torch.Tensor | None:
+        """Download, decode and preprocess one image, None if any step fails"""
+        try:
+            response = self._session.get(url, timeout=10)
+            response.raise_for_status()
+            image = Image.open(io.BytesIO(response.content)).convert('RGB')
+            return self._processor(image, return_tensors="pt")['pixel_values']
+        except Exception as e:
+            print(f"WARNING: Cannot load image {url}: {e}")
+            return None
+
+    def embed_images(self, urls: List[str], batch_size: int = 16) -> List[np.ndarray | None]:
+        """
+        Batch version of embed_image.
+        Images are downloaded with a pooled session and decoded/resized in a thread pool,
+        then embedded batch_size at a time in a single forward pass.
+
+        Args:
+            urls (List[str]): Image urls
+            batch_size (int): Number of images per forward pass
+
+        Returns:
+            List[np.ndarray | None]: float32 embedding of shape (768,) for each url, None where the image could not be loaded
+        """
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            pixels = list(executor.map(self._load_pixels, urls))
+        loaded = [i for i, pixel_values in enumerate(pixels) if pixel_values is not None]
+        embeddings: List[np.ndarray | None] = [None] * len(urls)
+        model = self._model
+        for start in range(0, len(loaded), batch_size):
+            batch = loaded[start:start + batch_size]
+            # The model is shared by every NomicEmbedVision of the process, and called from several crawl threads
+            with model_registry.lock(self._registry_key), torch.inference_mode():
+                img_emb = model(pixel_values=torch.cat([pixels[i] for i in batch])).last_hidden_state
+                img_embeddings = F.normalize(img_emb[:, 0], p=2, dim=1).numpy()
+            for i, embedding in zip(batch, img_embeddings):
+                embeddings[i] = embedding
+        return embeddings
     
     def embed_PIL_image(self, image: ImageFile) -> np.ndarray:
         inputs = self._processor(images=image, return_tensors="pt")
-        outputs = self._model(**inputs)
-        embeddings = F.normalize(outputs.last_hidden_state.mean(dim=1))
-        return embeddings.detach().numpy()[0]
+        model = self._model
+        with model_registry.lock(self._registry_key), torch.inference_mode():
+            outputs = model(**inputs)
+            embeddings = F.normalize(outputs.last_hidden_state.mean(dim=1))
+        return embeddings.numpy()[0]
@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict
+
+# Maximum number of concurrent calls per stage of the query pipeline.
+# 'embed' is 1: torch already uses every core for one forward pass, and the fast tokenizer
+# is not safe to call from several threads at once.
+DEFAULT_STAGE_LIMITS = {
+    'embed': 1,
+    'search': 4,
+    'llm': 16,
+}
+
+# Stages whose calls are blocking and run in the executor, the others are coroutines
+EXECUTOR_STAGES = ('embed', 'search')
+
+class Pipeline():
+    """
+    Runs the stages of a query without blocking the event loop.
+
+    Blocking stages (embedding, vector search) run in one shared thread pool, sized to the sum
+    of their limits so a stage can never starve another. Async stages (OpenAI calls) run on the event loop.
+    Every stage has its own semaphore, so e.g. a burst of LLM calls cannot queue unbounded work.
+    Internet searches have their own scheduler, see CrawlScheduler.
+
+    Attributes:
+        limits (Dict[str, int]): Maximum number of concurrent calls per stage
+        executor (ThreadPoolExecutor): Shared pool of the blocking stages
+    """
+    def __init__(self, limits: Dict[str, int] | None = None):
+        self.limits = {**DEFAULT_STAGE_LIMITS, **(limits or {})}
+        self.executor = ThreadPoolExecutor(
+            max_workers=sum(self.limits[stage] for stage in EXECUTOR_STAGES),
+            thread_name_prefix='pipeline',
+        )
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, stage: str) -> asyncio.Semaphore:
+        # Created on first use, so it belongs to the event loop of the server and not of the importer
+        if stage not in self._semaphores:
+            self._semaphores[stage] = asyncio.Semaphore(self.limits[stage])
+        return self._semaphores[stage]
+
+    def limit(self, stage: str) -> asyncio.Semaphore:
+        """Semaphore of a stage, for work that is not a single call (e.g. consuming a stream)"""
+        return self._semaphore(stage)
+
+    async def run_blocking(self, stage: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking call of a stage in the shared executor"""
+        async with self._semaphore(stage):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def run_async(self, stage: str, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """Await a coroutine function of a stage"""
+        async with self._semaphore(stage):
+            return await fn(*args, **kwargs)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
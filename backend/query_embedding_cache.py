@@ -0,0 +1,93 @@
+import os
+import re
+import numpy as np
+from .utils import LRUCache
+
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_query(query: str) -> str:
+    """Cache key of a query: whitespace collapsed, stripped and lowercased (the nomic tokenizer is uncased)"""
+    return _WHITESPACE.sub(' ', query).strip().lower()
+
+
+class QueryEmbeddingCache():
+    """
+    LRU cache of query embeddings in front of NomicEmbed, so repeated queries skip the transformer forward pass.
+    Keys are normalized query texts, values are read-only float32 embeddings.
+
+    The cache can be persisted to an .npz file (save/load), so popular queries stay warm across restarts.
+
+    Attributes:
+        embed_model (NomicEmbed): Model used on a miss
+        persist_path (str | None): .npz file the cache is loaded from and saved to, None to keep it in memory only
+        hits (int), misses (int): Counters of the underlying LRU
+    """
+    def __init__(self, embed_model, max_entries: int = 4096, persist_path: str | None = None):
+        self.embed_model = embed_model
+        self.persist_path = persist_path
+        self._cache = LRUCache(max_entries=max_entries)
+        if persist_path is not None and os.path.exists(persist_path):
+            self.load(persist_path)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def get_embedding(self, query: str) -> np.ndarray:
+        """
+        Float32 embedding of query (as NomicEmbed._get_embeddings_for_image_query), computed on a miss.
+        The returned array is shared between callers and must not be modified.
+        """
+        key = normalize_query(query)
+        embedding = self._cache.get(key)
+        if embedding is None:
+            embedding = np.asarray(self.embed_model._get_embeddings_for_image_query(query), dtype=np.float32)
+            embedding.flags.writeable = False
+            self._cache.put(key, embedding)
+        return embedding
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def save(self, path: str | None = None) -> None:
+        """Write the cached embeddings to an .npz file (least recently used first), through a temporary file"""
+        path = path or self.persist_path
+        if path is None:
+            return
+        items = self._cache.items()
+        keys = [key for key, _ in items]
+        embeddings = [embedding for _, embedding in items]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                keys=np.array(keys, dtype=str),
+                embeddings=np.stack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32),
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> None:
+        """Add the embeddings of an .npz file written by save, ignoring a corrupted file"""
+        try:
+            with np.load(path) as data:
+                keys, embeddings = data['keys'], data['embeddings']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"WARNING: Cannot load query embedding cache {path}: {e}")
+            return
+        for key, embedding in zip(keys, embeddings.astype(np.float32)):
+            embedding.flags.writeable = False
+            self._cache.put(str(key), embedding)
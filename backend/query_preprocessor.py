@@ -1,4 +1,4 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 class QueryPreprocessor:
     """
@@ -13,6 +13,7 @@ class QueryPreprocessor:
     """
     def __init__(self):
         self.client = OpenAI()
+        self.async_client = AsyncOpenAI()
 
     def preprocess_query(self, query: str, k: int = 1) -> list[str] | None:
         """
@@ -28,8 +29,21 @@ class QueryPreprocessor:
         """
         completion = self.client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": """
+            messages=self._preprocess_messages(query, k)
+        )
+        return self._split_queries(completion)
+
+    async def apreprocess_query(self, query: str, k: int = 1) -> list[str] | None:
+        """Async version of preprocess_query"""
+        completion = await self.async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=self._preprocess_messages(query, k)
+        )
+        return self._split_queries(completion)
+
+    def _preprocess_messages(self, query: str, k: int) -> list[dict]:
+        return [
+            {"role": "system", "content": """
                  You are a helpful query re-writer. 
                  You should translate the query to English (if it not already is), fix all typo, remove all punctuations and stopwords, and use regular-used vocabulary.
                  Your input will be in a form:
@@ -39,12 +53,13 @@ class QueryPreprocessor:
                  The input is guaranteed a user query, you might return edit suggestion if user's confirmation is required in the form:
                     Suggestion: <edit>
                  With <edit> is what you infer the user query is."""},
-                {
-                    "role": "user",
-                    "content": f"Query: {query}\nK: {k}"
-                }
-            ]
-        )
+            {
+                "role": "user",
+                "content": f"Query: {query}\nK: {k}"
+            }
+        ]
+
+    def _split_queries(self, completion) -> list[str] | None:
         try:
             res = completion.choices[0].message.content.split("\n")
         except Exception as e:
@@ -52,6 +67,29 @@ class QueryPreprocessor:
         # Make it as a list of queries
         return [r.strip() for r in res if r.strip() != ""]
     
+    def _search_query_messages(self, query: str) -> list[dict]:
+        return [
+            {"role": "system", "content": """
+            You are a helpful query optimizer for search engines.
+            Your goal is to transform user queries into a clean and optimized search query for web systems.
+            Steps:
+            - Translate the query to English (if not already).
+            - Fix typos and grammar errors.
+            - Remove punctuation and stopwords.
+            - Replace complex phrases with common and regular vocabulary.
+            - Ensure the final result is compact and highly relevant for search systems.
+
+            Input format:
+                Query: <query>
+            Output format:
+                <optimized_query>
+            """},
+            {
+                "role": "user",
+                "content": f"Query: {query}"
+            }
+        ]
+
     def process_query_for_search(self, query: str) -> str:
         """
         Processes a user query into a search-engine-friendly string by translating it to English (if necessary),
@@ -67,30 +105,21 @@ class QueryPreprocessor:
         try:
             completion = self.client.chat.completions.create(
                 model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": """
-                    You are a helpful query optimizer for search engines.
-                    Your goal is to transform user queries into a clean and optimized search query for web systems.
-                    Steps:
-                    - Translate the query to English (if not already).
-                    - Fix typos and grammar errors.
-                    - Remove punctuation and stopwords.
-                    - Replace complex phrases with common and regular vocabulary.
-                    - Ensure the final result is compact and highly relevant for search systems.
-
-                    Input format:
-                        Query: <query>
-                    Output format:
-                        <optimized_query>
-                    """},
-                    {
-                        "role": "user",
-                        "content": f"Query: {query}"
-                    }
-                ]
+                messages=self._search_query_messages(query)
             )
             # Extract the response content
             optimized_query = completion.choices[0].message.content.strip()
             return optimized_query
         except Exception as e:
             return ""
+
+    async def aprocess_query_for_search(self, query: str) -> str:
+        """Async version of process_query_for_search"""
+        try:
+            completion = await self.async_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self._search_query_messages(query)
+            )
+            return completion.choices[0].message.content.strip()
+        except Exception as e:
+            return ""
@@ -1,3 +1,4 @@
+import asyncio
 from enum import Enum, unique
 
 @unique
@@ -8,12 +9,61 @@ class QueryState(int, Enum):
     PENDING = 3
     SUCCESS = 4
     ERROR = 5
+    QUEUED = 6
+    STREAMING = 7
 
 class QuerySession:
+    """
+    State of the query of one websocket client.
+    Every state transition is published to the updates queue, so the websocket sender
+    awaits the next update instead of polling the session.
+
+    Attributes:
+        state (QueryState): Current state
+        result (any): Current (partial) result
+        updates (asyncio.Queue): {state, result} dicts not sent to the client yet, read with next_update
+    """
     def __init__(self, state: QueryState = QueryState.NONE, result: any = None):
         self.state = state
         self.result = result
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self._pending_partial: dict | None = None # STREAMING update still in the queue
+
+    @property
+    def busy(self) -> bool:
+        """A query is being processed"""
+        return self.state in {QueryState.SEARCHING_LOCAL, QueryState.SEARCHING_INTERNET, QueryState.PENDING, QueryState.QUEUED}
+
+    def publish(self, state: QueryState, result: any = None) -> None:
+        """Move to a new state and queue it for the client"""
+        self.state = state
+        self.result = result
+        self._pending_partial = None
+        self.updates.put_nowait(self.to_dict())
+
+    def publish_partial(self, partial_response: str) -> None:
+        """
+        Queue the answer generated so far, without changing state or result.
+        If the previous partial answer was not sent yet, it is replaced instead of queueing another one,
+        so a slow client receives only the latest text. The whole partial answer is sent (not the delta),
+        so replaced updates are harmless.
+        """
+        if self._pending_partial is not None:
+            self._pending_partial["result"]["partial_response"] = partial_response
+            return
+        self._pending_partial = {"state": QueryState.STREAMING, "result": {"partial_response": partial_response}}
+        self.updates.put_nowait(self._pending_partial)
+
+    async def next_update(self) -> dict:
+        """Wait for the next update to send to the client"""
+        update = await self.updates.get()
+        if update is self._pending_partial:
+            self._pending_partial = None
+        return update
+
+    def to_dict(self) -> dict:
+        return {"state": self.state, "result": self.result}
 
 class Query:
     def __init__(self, query: str):
-        self.query = query
\ No newline at end of file
+        self.query = query
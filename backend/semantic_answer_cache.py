@@ -0,0 +1,123 @@
+import threading
+import time
+from typing import Iterable, List, Set
+import numpy as np
+from .binary_quantized_rag.vector_index import hamming_distances
+from .binary_quantized_rag.document_store import post_id_of
+
+
+class CachedAnswer():
+    """
+    Attributes:
+        packed_query (np.ndarray): np.packbits of the binary quantized query
+        fragment_ids (frozenset): Text fragment ids retrieved for the query, the evidence of the answer
+        post_ids (Set[str]): Posts of the evidence
+        response (str): Final answer
+        search_phase (str): Phase that produced the answer (text_space, metadata_space, ...)
+        created_at (float): time.monotonic() when it was stored
+    """
+    def __init__(self, packed_query: np.ndarray, fragment_ids: frozenset, response: str, search_phase: str):
+        self.packed_query = packed_query
+        self.fragment_ids = fragment_ids
+        self.post_ids = {post_id_of(fragment_id) for fragment_id in fragment_ids}
+        self.response = response
+        self.search_phase = search_phase
+        self.created_at = time.monotonic()
+
+
+class SemanticAnswerCache():
+    """
+    Cache of final answers, so a repeated question with the same evidence skips the LLM calls.
+
+    An answer matches a new query if the Hamming distance between their binary quantized embeddings is at most
+    max_distance and the text search retrieved exactly the same fragments. Answers expire after ttl seconds.
+
+    When documents are (re)indexed, invalidate_posts drops the answers whose evidence comes from those posts,
+    and every answer that did not come from the text space: metadata and internet answers depend on
+    searches that are not part of the key, and new documents may change them.
+
+    Attributes:
+        max_distance (int): Maximum Hamming distance between the cached and the new query
+        ttl (float): Seconds an answer stays valid
+        max_entries (int): Oldest answers are dropped beyond this number
+        hits (int), misses (int): Lookup counters
+    """
+    def __init__(self, max_distance: int = 24, ttl: float = 3600.0, max_entries: int = 1024):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: List[CachedAnswer] = []
+        self._matrix: np.ndarray | None = None # packed queries of _entries, rebuilt after a change
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, binary_query: np.ndarray, fragment_ids: Iterable[str]) -> CachedAnswer | None:
+        """
+        Args:
+            binary_query (np.ndarray): Binary quantized query embedding (0/1 values)
+            fragment_ids (Iterable[str]): Ids of the texts retrieved for the query
+        Returns:
+            CachedAnswer | None: The closest matching answer, None on a miss
+        """
+        fragment_ids = frozenset(fragment_ids)
+        packed_query = np.packbits(np.asarray(binary_query, dtype=np.uint8))
+        with self._lock:
+            self._expire()
+            if self._entries:
+                distances = hamming_distances(self._packed_matrix(), packed_query)
+                for row in np.argsort(distances, kind='stable'):
+                    if distances[row] > self.max_distance:
+                        break
+                    if self._entries[row].fragment_ids == fragment_ids:
+                        self.hits += 1
+                        return self._entries[row]
+            self.misses += 1
+            return None
+
+    def store(self, binary_query: np.ndarray, fragment_ids: Iterable[str], response: str, search_phase: str) -> None:
+        if not response:
+            return
+        packed_query = np.packbits(np.asarray(binary_query, dtype=np.uint8))
+        with self._lock:
+            self._entries.append(CachedAnswer(packed_query, frozenset(fragment_ids), response, search_phase))
+            if len(self._entries) > self.max_entries:
+                del self._entries[:len(self._entries) - self.max_entries]
+            self._matrix = None
+
+    def invalidate_posts(self, post_ids: Iterable[str]) -> None:
+        """Drop answers that may be stale now that post_ids were indexed"""
+        post_ids: Set[str] = set(post_ids)
+        if not post_ids:
+            return
+        with self._lock:
+            kept = [
+                entry for entry in self._entries
+                if entry.search_phase == 'text_space' and not (entry.post_ids & post_ids)
+            ]
+            if len(kept) != len(self._entries):
+                self._entries = kept
+                self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = []
+            self._matrix = None
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        # Entries are in insertion order, so the expired ones are a prefix
+        n_expired = 0
+        while n_expired < len(self._entries) and self._entries[n_expired].created_at < deadline:
+            n_expired += 1
+        if n_expired:
+            del self._entries[:n_expired]
+            self._matrix = None
+
+    def _packed_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.stack([entry.packed_query for entry in self._entries])
+        return self._matrix
@@ -1,4 +1,4 @@
-from typing import Any, Callable, List, Optional, Sequence, TypedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypedDict
 from typing_extensions import Annotated
 
 import numpy as np
@@ -44,6 +44,7 @@ class SemanticSplitterNodeParser(NodeParser):
         paragraph_splitter (Optional[Callable]): splits text into paragraphs
         include_metadata (bool): whether to include metadata in nodes
         include_prev_next_rel (bool): whether to include prev/next relationships
+        embed_chunks (bool): whether to set the embedding of every node, reusing the paragraph group embeddings
     """
 
     paragraph_splitter: ParagraphSplitterCallable = Field(
@@ -74,6 +75,25 @@ class SemanticSplitterNodeParser(NodeParser):
         ),
     )
 
+    embed_chunks: bool = Field(
+        default=False,
+        description=(
+            "Set the embedding of every node. Without pooled_embeddings, a node whose text is a paragraph "
+            "group reuses its embedding (rare, chunks seldom match a group) and the others are embedded in one batch."
+        ),
+    )
+
+    pooled_embeddings: bool = Field(
+        default=False,
+        description=(
+            "Embed each paragraph once and build the group (and, with embed_chunks, node) embeddings as the "
+            "length weighted mean of the embeddings of their paragraphs, instead of embedding every group and "
+            "node text. Every paragraph goes through the embedding model once instead of about 2 * buffer_size + 2 "
+            "times. Pooled embeddings only approximate the embedding of the joined text, measure the agreement "
+            "with test-scripts/pooled_embedding_agreement.py before enabling it."
+        ),
+    )
+
     @classmethod
     def class_name(cls) -> str:
         return "SemanticSplitterNodeParser"
@@ -90,6 +110,8 @@ class SemanticSplitterNodeParser(NodeParser):
         include_prev_next_rel: bool = True,
         callback_manager: Optional[CallbackManager] = None,
         id_func: Optional[Callable[[int, Document], str]] = None,
+        embed_chunks: bool = False,
+        pooled_embeddings: bool = False,
     ) -> "SemanticSplitterNodeParser":
         callback_manager = callback_manager or CallbackManager([])
 
@@ -119,6 +141,8 @@ class SemanticSplitterNodeParser(NodeParser):
             include_prev_next_rel=include_prev_next_rel,
             callback_manager=callback_manager,
             id_func=id_func,
+            embed_chunks=embed_chunks,
+            pooled_embeddings=pooled_embeddings,
         )
 
     def _parse_nodes(
@@ -150,15 +174,26 @@ class SemanticSplitterNodeParser(NodeParser):
 
             paragraphs = self._build_paragraph_groups(text_splits)
 
-            combined_paragraph_embeddings = self.embed_model.get_text_embedding_batch(
-                [s["combined_paragraph"] for s in paragraphs],
-                show_progress=show_progress,
-            )
+            if self.pooled_embeddings:
+                pooled = self._paragraph_pooler(text_splits, show_progress)
+                combined_paragraph_embeddings = pooled(
+                    [
+                        (max(0, i - self.buffer_size), min(len(text_splits), i + 1 + self.buffer_size))
+                        for i in range(len(text_splits))
+                    ]
+                )
+            else:
+                combined_paragraph_embeddings = self.embed_model.get_text_embedding_batch(
+                    [s["combined_paragraph"] for s in paragraphs],
+                    show_progress=show_progress,
+                )
 
             for i, embedding in enumerate(combined_paragraph_embeddings):
                 paragraphs[i]["combined_paragraph_embedding"] = embedding
 
-            distances = self._calculate_distances_between_paragraph_groups(paragraphs)
+            distances = self._calculate_distances_between_paragraph_groups(
+                np.asarray(combined_paragraph_embeddings, dtype=np.float32)
+            )
 
             chunks = self._build_node_chunks(paragraphs, distances)
 
@@ -168,85 +203,127 @@ class SemanticSplitterNodeParser(NodeParser):
                 id_func=self.id_func,
             )
 
+            if self.embed_chunks:
+                if self.pooled_embeddings:
+                    # A chunk of empty paragraphs pools to a zero vector, it is embedded directly
+                    known_embeddings = {
+                        chunk: embedding
+                        for chunk, embedding in zip(chunks, pooled(self._chunk_ranges(len(paragraphs), distances)))
+                        if embedding.any()
+                    }
+                else:
+                    known_embeddings = {
+                        p["combined_paragraph"]: p["combined_paragraph_embedding"] for p in paragraphs
+                    }
+                self._embed_nodes(nodes, known_embeddings, show_progress)
+
             all_nodes.extend(nodes)
 
         return all_nodes
 
+    def _paragraph_pooler(
+        self, text_splits: List[str], show_progress: bool = False
+    ) -> Callable[[List[Tuple[int, int]]], np.ndarray]:
+        """
+        Embed each paragraph once and return a function mapping [start, end) paragraph ranges to the
+        normalized mean of their paragraph embeddings, weighted by paragraph length
+        (the model mean pools over tokens, so longer paragraphs weigh more in the embedding of the joined text).
+        """
+        embeddings = np.asarray(
+            self.embed_model.get_text_embedding_batch(text_splits, show_progress=show_progress),
+            dtype=np.float32,
+        ).reshape(len(text_splits), -1)
+        weights = np.array([len(x) for x in text_splits], dtype=np.float32)
+        # Prefix sums, the weighted sum of a range is one subtraction
+        cumulative = np.zeros((len(text_splits) + 1, embeddings.shape[1]), dtype=np.float32)
+        np.cumsum(embeddings * weights[:, None], axis=0, out=cumulative[1:])
+
+        def pool(ranges: List[Tuple[int, int]]) -> np.ndarray:
+            if not ranges:
+                return np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+            starts, ends = np.array(ranges).T
+            sums = cumulative[ends] - cumulative[starts]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            return sums / np.maximum(norms, np.finfo(np.float32).tiny)
+
+        return pool
+
+    def _embed_nodes(
+        self,
+        nodes: List[BaseNode],
+        known_embeddings: Dict[str, Any],
+        show_progress: bool = False,
+    ) -> None:
+        """Set node.embedding, embedding only the node texts without a known embedding"""
+        known_embeddings = dict(known_embeddings)
+        missing_texts = list(
+            dict.fromkeys(
+                node.get_content() for node in nodes if node.get_content() not in known_embeddings
+            )
+        )
+        if missing_texts:
+            missing_embeddings = self.embed_model.get_text_embedding_batch(
+                missing_texts, show_progress=show_progress
+            )
+            known_embeddings.update(zip(missing_texts, missing_embeddings))
+        for node in nodes:
+            node.embedding = np.asarray(
+                known_embeddings[node.get_content()], dtype=np.float32
+            ).tolist()
+
     def _build_paragraph_groups(
         self, text_splits: List[str]
     ) -> List[paragraphCombination]:
-        paragraphs: List[paragraphCombination] = [
+        # Each group is the paragraph with buffer_size neighbours on each side, joined once
+        # (a sliding window over the list instead of repeated string concatenation)
+        n_splits = len(text_splits)
+        return [
             {
                 "paragraph": x,
                 "index": i,
-                "combined_paragraph": "",
+                "combined_paragraph": "".join(
+                    text_splits[max(0, i - self.buffer_size) : min(n_splits, i + 1 + self.buffer_size)]
+                ),
                 "combined_paragraph_embedding": [],
             }
             for i, x in enumerate(text_splits)
         ]
 
-        # Group paragraphs and calculate embeddings for paragraph groups
-        for i in range(len(paragraphs)):
-            combined_paragraph = ""
-
-            for j in range(i - self.buffer_size, i):
-                if j >= 0:
-                    combined_paragraph += paragraphs[j]["paragraph"]
-
-            combined_paragraph += paragraphs[i]["paragraph"]
-
-            for j in range(i + 1, i + 1 + self.buffer_size):
-                if j < len(paragraphs):
-                    combined_paragraph += paragraphs[j]["paragraph"]
-
-            paragraphs[i]["combined_paragraph"] = combined_paragraph
-
-        return paragraphs
-
     def _calculate_distances_between_paragraph_groups(
-        self, paragraphs: List[paragraphCombination]
-    ) -> List[float]:
-        distances = []
-        for i in range(len(paragraphs) - 1):
-            embedding_current = paragraphs[i]["combined_paragraph_embedding"]
-            embedding_next = paragraphs[i + 1]["combined_paragraph_embedding"]
-
-            similarity = self.embed_model.similarity(embedding_current, embedding_next)
-
-            distance = 1 - similarity
-
-            distances.append(distance)
-
-        return distances
+        self, embeddings: np.ndarray
+    ) -> np.ndarray:
+        """Cosine distance between each group embedding (row) and the next one, in one row-wise dot product"""
+        if len(embeddings) < 2:
+            return np.zeros(0, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
+        similarities = np.einsum("ij,ij->i", normalized[:-1], normalized[1:])
+        return 1 - similarities
+
+    def _chunk_ranges(
+        self, n_paragraphs: int, distances: np.ndarray
+    ) -> List[Tuple[int, int]]:
+        """[start, end) paragraph range of each chunk, split after every distance above the percentile threshold"""
+        if len(distances) == 0:
+            return [(0, n_paragraphs)]
+        breakpoint_distance_threshold = np.percentile(
+            distances, self.breakpoint_percentile_threshold
+        )
+        indices_above_threshold = np.flatnonzero(
+            distances > breakpoint_distance_threshold
+        ).tolist()
+        starts = [0] + [index + 1 for index in indices_above_threshold]
+        ends = [index + 1 for index in indices_above_threshold] + [n_paragraphs]
+        return [(start, end) for start, end in zip(starts, ends) if start < end]
 
     def _build_node_chunks(
-        self, paragraphs: List[paragraphCombination], distances: List[float]
+        self, paragraphs: List[paragraphCombination], distances: np.ndarray
     ) -> List[str]:
         chunks = []
         if len(distances) > 0:
-            breakpoint_distance_threshold = np.percentile(
-                distances, self.breakpoint_percentile_threshold
-            )
-
-            indices_above_threshold = [
-                i for i, x in enumerate(distances) if x > breakpoint_distance_threshold
-            ]
-
             # Chunk paragraphs into semantic groups based on percentile breakpoints
-            start_index = 0
-
-            for index in indices_above_threshold:
-                group = paragraphs[start_index : index + 1]
-                combined_text = "".join([d["paragraph"] for d in group])
-                chunks.append(combined_text)
-
-                start_index = index + 1
-
-            if start_index < len(paragraphs):
-                combined_text = "".join(
-                    [d["paragraph"] for d in paragraphs[start_index:]]
-                )
-                chunks.append(combined_text)
+            for start, end in self._chunk_ranges(len(paragraphs), distances):
+                chunks.append("".join([d["paragraph"] for d in paragraphs[start:end]]))
         else:
             # If, for some reason we didn't get any distances (i.e. very, very small documents) just
             # treat the whole document as a single node
@@ -35,7 +35,9 @@ class SemanticChunker():
             self,
             buffer_size: int = 1,
             breakpoint_percentile_threshold: int = 75,
-            include_metadata: bool = True
+            include_metadata: bool = True,
+            embed_chunks: bool = False,
+            pooled_embeddings: bool = False
         ) -> None:
         """
         Initialize the SemanticChunker.
@@ -51,6 +53,10 @@ class SemanticChunker():
                                                     The smaller this number is, the more nodes 
                                                     will be generated.
             include_metadata (bool): Whether to include metadata in the chunking process.
+            embed_chunks (bool): Whether to set the embedding of every returned node. The embeddings
+                                 computed for chunking are reused, so callers need not embed the nodes again.
+            pooled_embeddings (bool): Whether to embed each paragraph once and pool paragraph embeddings into
+                                      group and chunk embeddings, instead of embedding every group and chunk text.
         """
         # self.embed_model = OpenAIEmbedding(
         #     mode=mode,
@@ -64,6 +70,8 @@ class SemanticChunker():
             breakpoint_percentile_threshold=breakpoint_percentile_threshold,
             embed_model=self.embed_model,
             include_metadata=include_metadata,
+            embed_chunks=embed_chunks,
+            pooled_embeddings=pooled_embeddings,
         )
 
     def chunk_nodes_from_documents(self, documents: List[LlamaIndexDocument]) -> List[TextNode]:
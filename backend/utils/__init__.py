@@ -1 +1,2 @@
-from .utils import *
\ No newline at end of file
+from .utils import *
+from .lru_cache import LRUCache
\ No newline at end of file
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Tuple
+
+class LRUCache():
+    """
+    Thread-safe least-recently-used cache, bounded by number of entries and optionally by total size.
+
+    Attributes:
+        max_entries (int): Maximum number of entries
+        max_size (int | None): Maximum total size of the values as measured by sizeof, None for no limit
+        sizeof (Callable[[Any], int]): Size of a value, default counts every value as 1
+        hits (int): Number of get calls that found their key
+        misses (int): Number of get calls that did not
+    """
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_size: int | None = None,
+        sizeof: Callable[[Any], int] | None = None,
+    ):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 1)
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._sizes: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached values"""
+        return self._size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value and mark it as most recently used, or default if absent"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Insert or replace a value, then evict least recently used entries until within bounds"""
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_size is not None and size > self.max_size:
+                return # would evict everything else and still not fit
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._size += size
+            while len(self._entries) > self.max_entries or (self.max_size is not None and self._size > self.max_size):
+                self._remove(next(iter(self._entries)))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key (e.g. when the underlying data changed) and return its value"""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries[key]
+            self._remove(key)
+            return value
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of the (key, value) pairs, least recently used first. Does not change the recency order"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._size = 0
+
+    def _remove(self, key: Hashable) -> None:
+        del self._entries[key]
+        self._size -= self._sizes.pop(key)
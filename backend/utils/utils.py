@@ -1,10 +1,12 @@
 import numpy as np
 import base64
 import io
+from typing import List, Tuple
 
 def binary_array_to_base64(arr:np.ndarray) -> str:
     """
     Converts a numpy array of 0's and 1's (uint8 type) to a Base64-encoded string.
+    Bits are packed with np.packbits, left-padded with 0's to a multiple of 8.
     
     Parameters:
     arr (np.ndarray): Numpy array with dtype `np.uint8` containing only 0's and 1's.
@@ -12,16 +14,12 @@ def binary_array_to_base64(arr:np.ndarray) -> str:
     Returns:
     str: Base64-encoded string.
     """
-    if not isinstance(arr, np.ndarray) or arr.dtype != np.uint8 or not np.all((arr == 0) | (arr == 1)):
+    if not isinstance(arr, np.ndarray) or arr.dtype != np.uint8 or arr.max(initial=0) > 1:
         raise ValueError("Input must be a numpy array of uint8 with only 0 and 1 values")
-    binary_string = ''.join(str(bit) for bit in arr)
-    padding_length = (8 - len(binary_string) % 8) % 8
-    binary_string = '0' * padding_length + binary_string
-    byte_array = bytearray()
-    for i in range(0, len(binary_string), 8):
-        byte_array.append(int(binary_string[i:i+8], 2))
-    base64_encoded = base64.b64encode(byte_array).decode('utf-8')
-    return base64_encoded
+    padding_length = (8 - len(arr) % 8) % 8
+    if padding_length:
+        arr = np.concatenate((np.zeros(padding_length, dtype=np.uint8), arr))
+    return base64.b64encode(np.packbits(arr).tobytes()).decode('utf-8')
 
 def base64_to_binary_array(base64_str: str) -> np.ndarray:
     """
@@ -33,10 +31,74 @@ def base64_to_binary_array(base64_str: str) -> np.ndarray:
     Returns:
     np.ndarray: Numpy array with dtype `np.uint8` containing 0's and 1's.
     """
-    byte_array = base64.b64decode(base64_str)
-    binary_string = ''.join(format(byte, '08b') for byte in byte_array)
-    binary_array = np.array([int(bit) for bit in binary_string], dtype=np.uint8)
-    return binary_array
+    return np.unpackbits(np.frombuffer(base64.b64decode(base64_str), dtype=np.uint8))
+
+def _decode_base64_batch(base64_strs: List[str]) -> Tuple[bytes, int]:
+    """Decode a list of Base64 strings of the same decoded length into one buffer"""
+    decoded = [base64.b64decode(s) for s in base64_strs]
+    width = len(decoded[0]) if decoded else 0
+    if any(len(d) != width for d in decoded):
+        raise ValueError("All Base64 strings of a batch must decode to the same number of bytes")
+    return b''.join(decoded), width
+
+def base64_batch_to_packed_matrix(base64_strs: List[str]) -> np.ndarray:
+    """
+    Decodes a list of Base64-encoded binary vectors into one packed matrix, without unpacking the bits.
+    Row i is np.packbits(base64_to_binary_array(base64_strs[i])).
+
+    Parameters:
+    base64_strs (List[str]): Base64-encoded strings, all of the same length.
+
+    Returns:
+    np.ndarray: uint8 matrix of shape (len(base64_strs), n_bytes).
+    """
+    buffer, width = _decode_base64_batch(base64_strs)
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(len(base64_strs), width)
+
+def base64_batch_to_binary_matrix(base64_strs: List[str]) -> np.ndarray:
+    """
+    Decodes a list of Base64-encoded binary vectors into one matrix of 0's and 1's.
+    Row i equals base64_to_binary_array(base64_strs[i]).
+
+    Parameters:
+    base64_strs (List[str]): Base64-encoded strings, all of the same length.
+
+    Returns:
+    np.ndarray: uint8 matrix of shape (len(base64_strs), n_bits).
+    """
+    return np.unpackbits(base64_batch_to_packed_matrix(base64_strs), axis=1)
+
+def binary_matrix_to_base64_batch(matrix: np.ndarray) -> List[str]:
+    """
+    Encodes every row of a matrix of 0's and 1's, same output as binary_array_to_base64 on each row.
+
+    Parameters:
+    matrix (np.ndarray): uint8 matrix of shape (n, n_bits) containing only 0's and 1's.
+
+    Returns:
+    List[str]: Base64-encoded strings, one per row.
+    """
+    if not isinstance(matrix, np.ndarray) or matrix.dtype != np.uint8 or matrix.ndim != 2 or matrix.max(initial=0) > 1:
+        raise ValueError("Input must be a 2D numpy array of uint8 with only 0 and 1 values")
+    padding_length = (8 - matrix.shape[1] % 8) % 8
+    if padding_length:
+        matrix = np.concatenate((np.zeros((len(matrix), padding_length), dtype=np.uint8), matrix), axis=1)
+    packed = np.packbits(matrix, axis=1)
+    return [base64.b64encode(row.tobytes()).decode('utf-8') for row in packed]
+
+def base64_batch_to_float32_matrix(base64_strs: List[str]) -> np.ndarray:
+    """
+    Decodes a list of Base64-encoded float32 vectors into one matrix.
+    Row i equals base64_to_float32_vector(base64_strs[i]).
+
+    Parameters:
+    base64_strs (List[str]): Base64-encoded strings, all of the same length.
+
+    Returns:
+    np.ndarray: float32 matrix of shape (len(base64_strs), dim).
+    """
+    buffer, width = _decode_base64_batch(base64_strs)
+    return np.frombuffer(buffer, dtype=np.float32).reshape(len(base64_strs), width // 4)
 
 
 def binary_quantized(embedding: np.ndarray) ->np.ndarray:
@@ -111,3 +173,43 @@ def float32_vector_to_base64(vector: np.ndarray) -> str:
     
     return base64.b64encode(byte_data).decode('utf-8')
 
+
+def int8_vector_to_base64(vector: np.ndarray) -> str:
+    """
+    Convert a numpy array of dtype=np.int8 (e.g. from scalar_quantized) to a base64-encoded string.
+
+    Args:
+        vector (np.ndarray): A 1D numpy array of dtype=np.int8.
+
+    Returns:
+        str: The base64-encoded string representing the array.
+    """
+    if vector.dtype != np.int8:
+        raise ValueError("Input array must have dtype=np.int8")
+    return base64.b64encode(vector.tobytes()).decode('utf-8')
+
+def base64_to_int8_vector(base64_str: str) -> np.ndarray:
+    """
+    Convert a base64-encoded string to a numpy array of dtype=np.int8.
+
+    Args:
+        base64_str (str): The base64-encoded string representing the array.
+
+    Returns:
+        np.ndarray: A 1D numpy array of dtype=np.int8.
+    """
+    return np.frombuffer(base64.b64decode(base64_str), dtype=np.int8)
+
+def base64_batch_to_int8_matrix(base64_strs: List[str]) -> np.ndarray:
+    """
+    Decodes a list of Base64-encoded int8 vectors into one matrix.
+    Row i equals base64_to_int8_vector(base64_strs[i]).
+
+    Parameters:
+    base64_strs (List[str]): Base64-encoded strings, all of the same length.
+
+    Returns:
+    np.ndarray: int8 matrix of shape (len(base64_strs), dim).
+    """
+    buffer, width = _decode_base64_batch(base64_strs)
+    return np.frombuffer(buffer, dtype=np.int8).reshape(len(base64_strs), width)
@@ -9,13 +9,14 @@ import json
 import os
 import sys
 import math
-from typing import List, Optional, Dict, Any,  Optional
+from typing import List, Optional, Dict, Any,  Optional, Tuple
+import numpy as np
 from datetime import datetime
 from dotenv import load_dotenv
 SYSTEM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 load_dotenv(dotenv_path=f"{SYSTEM_PATH}/backend/.env")
 sys.path.append(SYSTEM_PATH)
-from backend.utils import binary_quantized, binary_array_to_base64, float32_vector_to_base64
+from backend.utils import binary_quantized, binary_array_to_base64, float32_vector_to_base64, scalar_quantized, int8_vector_to_base64
 from backend.semantice_chunker import SemanticChunker
 from backend.nomic_embed import NomicEmbed
 from backend.nomic_embed_vision import NomicEmbedVision
@@ -75,9 +76,15 @@ class CNNCrawler:
         get_embed_text(text: str) -> str:
             Generates a binary quantized embedding for text and encodes it as Base64.
 
+        get_embed_text_with_rescore(text: str) -> Tuple[str, str]:
+            Generates the binary quantized and the int8 (rescoring) embeddings of a text, both encoded as Base64.
+
         get_embed_img(img_url: str) -> str:
             Generates an embedding for an image URL and encodes it as Base64.
 
+        get_embed_imgs(img_urls: List[str]) -> List[str | None]:
+            Generates the embeddings of many image URLs in batches, None for the images that cannot be loaded.
+
         scrape_post(url: str) -> None:
             Scrapes an article from CNN, extracts metadata, content, and embeddings, 
             and saves the data to a JSON file.
@@ -119,7 +126,7 @@ class CNNCrawler:
         self.visited_links = self.load_visited_links()
         self.text_embed_model = NomicEmbed()
         self.vision_embed_model = NomicEmbedVision()
-        self.semantic_chunker = SemanticChunker(breakpoint_percentile_threshold=60)
+        self.semantic_chunker = SemanticChunker(breakpoint_percentile_threshold=60, embed_chunks=True)
         self.driver = Driver()
 
     def load_visited_links(self) -> set:
@@ -150,10 +157,21 @@ class CNNCrawler:
         embedding = binary_quantized(embedding)
         return binary_array_to_base64(embedding)
     
+    def get_embed_text_with_rescore(self, text: str, embedding: List[float] | None = None) -> Tuple[str, str]:
+        """Binary and int8 embeddings of text, from embedding if it was already computed (e.g. by the chunker)"""
+        if embedding is None:
+            embedding = self.text_embed_model.get_text_embedding(text)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return binary_array_to_base64(binary_quantized(embedding)), int8_vector_to_base64(scalar_quantized(embedding))
+    
     def get_embed_img(self, img_url:str)->str:
         img_embedding = self.vision_embed_model.embed_image(img_url)
         return float32_vector_to_base64(img_embedding)
 
+    def get_embed_imgs(self, img_urls: List[str]) -> List[str | None]:
+        img_embeddings = self.vision_embed_model.embed_images(img_urls)
+        return [None if embedding is None else float32_vector_to_base64(embedding) for embedding in img_embeddings]
+
 
     def scrape_post(self, url: str) -> None:
         if url in self.visited_links:
@@ -278,9 +296,11 @@ class CNNCrawler:
         for i, node in enumerate(nodes, start=1):
             text = node.text.strip()
             if text:
+                embedding, rescore_embedding = self.get_embed_text_with_rescore(text, node.embedding)
                 paragraph: Dict[str, Any] = {
                     "content": text,
-                    "embedding": self.get_embed_text(text)
+                    "embedding": embedding,
+                    "rescore_embedding": rescore_embedding,
                 }
                 key = f"{ID}_text_{i}"
                 paragraphs[key] = paragraph
@@ -288,7 +308,7 @@ class CNNCrawler:
         return paragraphs
 
     def extract_images(self, soup: BeautifulSoup, ID:str) -> List[Dict[str, str]]:
-        images_infos : Dict[str, Any] = {}
+        candidates = []
         img_tags = soup.find_all('img', class_='image__dam-img')
         for i,img_tag in enumerate(img_tags, start=1):
             if img_tag.find_parent(class_='related-content') or img_tag.find_parent(class_='video-resource__image') or img_tag.find_parent(class_='container__item-media') or img_tag.find_parent(class_='image__related-content'):
@@ -296,13 +316,20 @@ class CNNCrawler:
             image_url = img_tag.get('src')
             image_alt = img_tag.get('alt')
             if image_url and image_alt and "http" in image_url:
-                images_info : Dict[str, Any] = {
-                    "image_url":image_url,
-                    "image_alt": image_alt,
-                    "embedding" : self.get_embed_img(image_url)
-                }
-                key = f"{ID}_image_{i}"
-                images_infos[key] = images_info
+                candidates.append((i, image_url, image_alt))
+
+        images_infos : Dict[str, Any] = {}
+        embeddings = self.get_embed_imgs([image_url for _, image_url, _ in candidates])
+        for (i, image_url, image_alt), embedding in zip(candidates, embeddings):
+            if embedding is None:
+                continue
+            images_info : Dict[str, Any] = {
+                "image_url":image_url,
+                "image_alt": image_alt,
+                "embedding" : embedding
+            }
+            key = f"{ID}_image_{i}"
+            images_infos[key] = images_info
         return images_infos
     
     def extract_srt(self, soup: BeautifulSoup, ID: str) -> List[Dict[str, str]]:
@@ -325,9 +352,11 @@ class CNNCrawler:
                                     for i, node in enumerate(nodes, start=1):
                                         text = node.text.strip()
                                         if text:
+                                            embedding, rescore_embedding = self.get_embed_text_with_rescore(text, node.embedding)
                                             paragraph: Dict[str, Any] = {
                                                 "content": text,
-                                                "embedding": self.get_embed_text(text)
+                                                "embedding": embedding,
+                                                "rescore_embedding": rescore_embedding,
                                             }
                                             key = f"{ID}_text_{i}"
                                             paragraphs[key] = paragraph
@@ -343,9 +372,11 @@ class CNNCrawler:
                             for i, node in enumerate(nodes, start=1):
                                 text = node.text.strip()
                                 if text:
+                                    embedding, rescore_embedding = self.get_embed_text_with_rescore(text, node.embedding)
                                     paragraph: Dict[str, Any] = {
                                         "content": text,
-                                        "embedding": self.get_embed_text(text)
+                                        "embedding": embedding,
+                                        "rescore_embedding": rescore_embedding,
                                     }
                                     key = f"{ID}_text_{i}"
                                     paragraphs[key] = paragraph
@@ -382,17 +413,20 @@ class CNNSearcher:
     Attributes:
         base_url (str): The CNN search page URL (default: 'https://edition.cnn.com/search').
         scrawler (CNNCrawler): Handles scraping content from individual posts.
+        executor (ThreadPoolExecutor): Scrapes the posts of every search_posts call, so concurrent crawls
+            share max_workers threads (and Chrome instances) instead of each starting its own.
 
     Methods:
         search(keyword: str, size: int = 10, page: int = 1, sort: str = "newest") -> List[str]:
             Retrieves a list of article or video URLs for a given keyword with optional pagination and sorting.
 
-        search_posts(keyword: str, size: int = 10, max_workers: int = os.cpu_count() * 2) -> List[dict]:
+        search_posts(keyword: str, size: int = 10) -> List[dict]:
             Fetches and parses search results for a keyword, returning content as a list of dictionaries.
     """
-    def __init__(self, base_url: str = "https://edition.cnn.com/search"):
+    def __init__(self, base_url: str = "https://edition.cnn.com/search", max_workers: int = os.cpu_count() * 2):
         self.base_url = base_url
         self.scrawler =  CNNCrawler()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cnn-scrape')
 
     def search(self, keyword: str, size: int = 10, page: int = 1, sort: str = "newest") -> List[str]:
         start_index = (page - 1) * size
@@ -425,7 +459,7 @@ class CNNSearcher:
         finally:
             driver.quit()
 
-    def search_posts(self, keyword: str, size: int = 10, max_workers: int = os.cpu_count() * 2):
+    def search_posts(self, keyword: str, size: int = 10):
         links = []
         page_count = math.ceil(size / 10)
 
@@ -440,15 +474,17 @@ class CNNSearcher:
 
         contents = []
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_link = {executor.submit(self.scrawler.scrape_post, link): link for link in links}
-            for future in as_completed(future_to_link):
-                link = future_to_link[future]
-                try:
-                    content = future.result()
-                    if content:
-                        contents.append(content)
-                except Exception as e:
-                    print(f"Error processing {link}: {e}")
-
-        return contents
\ No newline at end of file
+        future_to_link = {self.executor.submit(self.scrawler.scrape_post, link): link for link in links}
+        for future in as_completed(future_to_link):
+            link = future_to_link[future]
+            try:
+                content = future.result()
+                if content:
+                    contents.append(content)
+            except Exception as e:
+                print(f"Error processing {link}: {e}")
+
+        return contents
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -3,7 +3,7 @@ import json
 import sys
 import re
 import requests
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from bs4 import BeautifulSoup
 from datetime import datetime
 from dotenv import load_dotenv
@@ -33,9 +33,15 @@ class MediumScraper:
         get_embed_text(text: str) -> str:
             Generates and returns the base64-encoded text embedding for the given text.
 
+        get_embed_text_with_rescore(text: str) -> Tuple[str, str]:
+            Generates and returns the base64-encoded binary and int8 (rescoring) embeddings for the given text.
+
         get_embed_img(img_url: str) -> str:
             Generates and returns the base64-encoded image embedding for the given image URL.
 
+        get_embed_imgs(img_urls: List[str]) -> List[str | None]:
+            Generates the base64-encoded embeddings of many image URLs in batches, None for the images that cannot be loaded.
+
         search_posts(query: str, k: int = 10) -> List[str]:
             Searches Medium for the top k articles based on a query and returns a list of article IDs.
 
@@ -97,10 +103,18 @@ class MediumScraper:
         embedding = binary_quantized(embedding)
         return binary_array_to_base64(embedding)
     
+    def get_embed_text_with_rescore(self, text: str) -> Tuple[str, str]:
+        embedding = np.asarray(self.text_embed_model.get_text_embedding(text), dtype=np.float32)
+        return binary_array_to_base64(binary_quantized(embedding)), int8_vector_to_base64(scalar_quantized(embedding))
+    
     def get_embed_img(self, img_url:str)->str:
         img_embedding = self.vision_embed_model.embed_image(img_url)
         return float32_vector_to_base64(img_embedding)
 
+    def get_embed_imgs(self, img_urls: List[str]) -> List[str | None]:
+        img_embeddings = self.vision_embed_model.embed_images(img_urls)
+        return [None if embedding is None else float32_vector_to_base64(embedding) for embedding in img_embeddings]
+
     def search_posts(self, query: str, k: int = 10) -> List[str]:
         endpoint = f"{self.base_url}/search/articles"
         headers = {
@@ -210,7 +224,8 @@ class MediumScraper:
             if text:
                 text_cleaned = re.sub(r'"', '', text)
                 key = f"{ID}_text_{i}"
-                result[key] = {"content": text_cleaned, "embedding": self.get_embed_text(text_cleaned)}
+                embedding, rescore_embedding = self.get_embed_text_with_rescore(text_cleaned)
+                result[key] = {"content": text_cleaned, "embedding": embedding, "rescore_embedding": rescore_embedding}
 
         return result
     
@@ -219,6 +234,7 @@ class MediumScraper:
 
         soup = BeautifulSoup(html, 'html.parser')
 
+        candidates = []
         for i, img in enumerate(soup.find_all('img'), start=1):
             img_url = img.get('src')
             if img_url:
@@ -226,9 +242,15 @@ class MediumScraper:
                     img_url = json.loads(f'"{img_url}"') if '\\' in img_url else img_url
                 except json.JSONDecodeError:
                     pass
+                candidates.append((i, img_url.strip('"')))
+
+        embeddings = self.get_embed_imgs([img_url for _, img_url in candidates])
+        for (i, img_url), embedding in zip(candidates, embeddings):
+            if embedding is None:
+                continue
             images_info: Dict[str, Any] = {
-                "image_url": img_url.strip('"'),
-                "embedding": self.get_embed_img(img_url)
+                "image_url": img_url,
+                "embedding": embedding
             }
 
             key = f"{ID}_image_{i}"
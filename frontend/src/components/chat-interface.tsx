@@ -42,7 +42,9 @@ enum QueryState {
   SEARCHING_INTERNET,
   PENDING,
   SUCCESS,
-  ERROR
+  ERROR,
+  QUEUED,
+  STREAMING
 }
 
 export const ACCEPTED_DOCUMENT_MIME_TYPES = new Set<string>(['application/pdf', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']);
@@ -58,6 +60,8 @@ export default function ChatInterface() {
   const [isInputAreaDisabled, setIsInputAreaDisabled] = useState(false)
   const [isMobile, setIsMobile] = useState(false)
   const [canUpload, setCanUpload] = useState(true)
+  // Id of the assistant message being streamed, replaced by the final answer on SUCCESS
+  const [streamingMessageId, setStreamingMessageId] = useState<number | null>(null)
   const { toast } = useToast()
   const { sendJsonMessage, lastJsonMessage, readyState } = useWebSocket("ws://localhost:4000/api/process-query", {
     share: true
@@ -120,17 +124,56 @@ export default function ChatInterface() {
           ))
           setIsTyping(true);
           break;
+        case QueryState.QUEUED:
+          const assistantQueuedMessage: Message = {
+            id: currentConversation.messages.length + 1,
+            content: `Waiting for ${message.result.queue_position} other internet search(es) to finish...`,
+            role: 'assistant'
+          }
+          const updatedConversationQueued = {
+            ...currentConversation,
+            messages: [...currentConversation.messages, assistantQueuedMessage]
+          }
+          setCurrentConversation(updatedConversationQueued)
+          setConversations(conversations.map(conv =>
+            conv.id === currentConversation.id ? updatedConversationQueued : conv
+          ))
+          setIsTyping(true);
+          break;
+        case QueryState.STREAMING:
+          // partial_response is the whole answer so far, so skipped updates are harmless
+          const streamingMessage: Message = {
+            id: streamingMessageId ?? currentConversation.messages.length + 1,
+            content: message.result.partial_response,
+            role: 'assistant'
+          }
+          const updatedConversationStreaming = {
+            ...currentConversation,
+            messages: streamingMessageId === null
+              ? [...currentConversation.messages, streamingMessage]
+              : currentConversation.messages.map(msg => msg.id === streamingMessageId ? streamingMessage : msg)
+          }
+          setStreamingMessageId(streamingMessage.id)
+          setCurrentConversation(updatedConversationStreaming)
+          setConversations(conversations.map(conv =>
+            conv.id === currentConversation.id ? updatedConversationStreaming : conv
+          ))
+          setIsTyping(true) // keeps the input disabled until SUCCESS
+          break;
         case QueryState.SUCCESS:
           const assistantMessage: Message = {
-            id: currentConversation.messages.length + 1,
+            id: streamingMessageId ?? currentConversation.messages.length + 1,
             content: message.result.final_response,
             role: 'assistant'
           }
     
           const updatedConversation = {
             ...currentConversation,
-            messages: [...currentConversation.messages, assistantMessage]
+            messages: streamingMessageId === null
+              ? [...currentConversation.messages, assistantMessage]
+              : currentConversation.messages.map(msg => msg.id === streamingMessageId ? assistantMessage : msg)
           }
+          setStreamingMessageId(null)
     
           setCurrentConversation(updatedConversation)
           setConversations(conversations.map(conv =>
@@ -274,7 +317,13 @@ export default function ChatInterface() {
       try {
         const formData = new FormData();
         formData.append('file', file);
-        await api.postForm('/api/upload-document', formData);
+        const response = await api.postForm('/api/upload-document', formData);
+        if (response.data?.state === 'duplicate') {
+          toast({
+            title: "Document already uploaded",
+            description: "This document has already been indexed."
+          })
+        }
       }
       catch (error) {
         toast({
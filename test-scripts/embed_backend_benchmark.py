@@ -0,0 +1,89 @@
+"""
+Benchmark of the NomicEmbed inference backends on the chunk corpus.
+
+Embeds the chunk texts of the database with every backend (fp32 torch, int8 dynamic-quantized
+torch, ONNX Runtime) and reports the throughput and how well the binary quantized embeddings
+agree with the fp32 reference, since binary vectors are what the text index searches:
+    - mean bit agreement: fraction of the 768 bits equal to the reference, averaged over chunks
+    - >=99% agreement: fraction of chunks whose binary vector differs in at most 1% of the bits
+    - top-10 overlap: overlap of the Hamming top-10 of each chunk used as a query
+
+Usage:
+    python test-scripts/embed_backend_benchmark.py --limit 1000 --threads 8
+"""
+import sys
+import os
+
+SYSTEM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SYSTEM_PATH)
+
+import argparse
+import json
+import time
+import numpy as np
+from backend import NomicEmbed
+from backend.utils import binary_quantized
+from backend.binary_quantized_rag.vector_index import hamming_distances
+
+def load_chunk_texts(database_path: str, limit: int) -> list:
+    texts = []
+    for file_name in sorted(os.listdir(database_path)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(database_path, file_name), 'r') as f:
+            data = json.load(f)
+        for value in (data.get('content') or {}).values():
+            if value.get('content'):
+                texts.append(value['content'])
+            if len(texts) >= limit:
+                return texts
+    return texts
+
+def hamming_top_k(packed: np.ndarray, k: int) -> np.ndarray:
+    """Hamming top-k of each row among the other rows, one row of distances at a time"""
+    top = np.empty((len(packed), k), dtype=np.int64)
+    for i, query in enumerate(packed):
+        distances = hamming_distances(packed, query)
+        distances[i] = np.iinfo(distances.dtype).max # not its own neighbour
+        top[i] = np.argsort(distances, kind='stable')[:k]
+    return top
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', default='./resources/quantized-db')
+    parser.add_argument('--limit', type=int, default=1000, help='number of chunks to embed')
+    parser.add_argument('--threads', type=int, default=None, help='onnxruntime intra-op threads')
+    parser.add_argument('--backends', nargs='+', default=list(NomicEmbed.BACKENDS))
+    args = parser.parse_args()
+
+    texts = load_chunk_texts(args.database, args.limit)
+    print(f"{len(texts)} chunks from {args.database}")
+
+    binaries = {}
+    for backend in args.backends:
+        embed_model = NomicEmbed(backend=backend, onnx_threads=args.threads)
+        embed_model.load()
+        embed_model.get_text_embedding_batch(texts[:32]) # warm up
+        start = time.perf_counter()
+        embeddings = embed_model.get_text_embedding_batch(texts)
+        elapsed = time.perf_counter() - start
+        binaries[backend] = np.packbits(np.stack([binary_quantized(np.array(e)) for e in embeddings]), axis=1)
+        print(f"{backend:>10}: {len(texts) / elapsed:8.1f} texts/s ({elapsed:.1f}s)")
+
+    reference = binaries.get('torch')
+    if reference is None:
+        return
+    reference_top = hamming_top_k(reference, 10)
+    for backend, packed in binaries.items():
+        if backend == 'torch':
+            continue
+        agreement = 1 - np.unpackbits(packed ^ reference, axis=1).mean(axis=1)
+        top = hamming_top_k(packed, 10)
+        overlap = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(top, reference_top)])
+        print(
+            f"{backend:>10}: mean bit agreement {agreement.mean():.4f}, >=99% agreement {(agreement >= 0.99).mean():.3f}"
+            f", top-10 overlap {overlap:.3f}"
+        )
+
+if __name__ == '__main__':
+    main()
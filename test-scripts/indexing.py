@@ -31,6 +31,7 @@ for filename in os.listdir(directory_path):
                         for key, value in data['content'].items():
                             print(value['content'])
                             embedding = text_embed_model._get_text_embedding(value['content'])
+                            value['rescore_embedding'] = int8_vector_to_base64(scalar_quantized(embedding))
                             embedding = binary_quantized(embedding)
                             base64_str = binary_array_to_base64(embedding)
                             value['embedding'] = base64_str
@@ -0,0 +1,93 @@
+"""
+Agreement of the pooled chunk embeddings of the semantic splitter with direct embeddings.
+
+With pooled_embeddings, SemanticSplitterNodeParser embeds every paragraph once and builds the group and
+chunk embeddings as length weighted means of paragraph embeddings, instead of running the model on every
+group and chunk text. This script chunks documents of the database both ways and reports:
+    - time of each mode and the number of texts sent to the model
+    - chunk agreement: Jaccard index of the chunk texts of both modes (pooled groups move some breakpoints)
+    - cosine between the pooled embedding of a chunk and the direct embedding of its text
+    - bit agreement of their binary quantized vectors (what the text space searches)
+
+Paragraphs of a post are its stored chunk texts, one per line.
+
+Usage:
+    python test-scripts/pooled_embedding_agreement.py --posts 50
+"""
+import sys
+import os
+
+SYSTEM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SYSTEM_PATH)
+
+import argparse
+import json
+import time
+import numpy as np
+from llama_index.core.schema import Document as LlamaIndexDocument
+from backend import NomicEmbed
+from backend.utils import binary_quantized
+from backend.semantice_chunker.paragraph_semantic_splitter import SemanticSplitterNodeParser
+
+class CountingEmbed(NomicEmbed):
+    """NomicEmbed counting the texts it embeds"""
+    def get_text_embedding_batch(self, texts, show_progress=False, **kwargs):
+        global n_embedded
+        n_embedded += len(texts)
+        return super().get_text_embedding_batch(texts, show_progress=show_progress, **kwargs)
+
+n_embedded = 0
+
+def load_documents(database_path: str, n_posts: int) -> list:
+    documents = []
+    for file_name in sorted(os.listdir(database_path)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(database_path, file_name), 'r') as f:
+            data = json.load(f)
+        paragraphs = [value['content'] for value in (data.get('content') or {}).values() if value.get('content')]
+        if len(paragraphs) >= 3:
+            documents.append(LlamaIndexDocument(text="\n".join(paragraphs)))
+        if len(documents) >= n_posts:
+            break
+    return documents
+
+def chunk(embed_model, documents: list, pooled: bool):
+    global n_embedded
+    splitter = SemanticSplitterNodeParser.from_defaults(
+        embed_model=embed_model, breakpoint_percentile_threshold=60, embed_chunks=True, pooled_embeddings=pooled
+    )
+    n_embedded = 0
+    start = time.perf_counter()
+    nodes = splitter.build_semantic_nodes_from_documents(documents)
+    return nodes, time.perf_counter() - start, n_embedded
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', default='./resources/quantized-db')
+    parser.add_argument('--posts', type=int, default=50)
+    args = parser.parse_args()
+
+    documents = load_documents(args.database, args.posts)
+    embed_model = CountingEmbed()
+    embed_model.load()
+    direct_nodes, direct_time, direct_texts = chunk(embed_model, documents, pooled=False)
+    pooled_nodes, pooled_time, pooled_texts = chunk(embed_model, documents, pooled=True)
+    print(f"direct: {direct_time:.1f}s, {direct_texts} texts embedded, {len(direct_nodes)} chunks")
+    print(f"pooled: {pooled_time:.1f}s, {pooled_texts} texts embedded, {len(pooled_nodes)} chunks")
+
+    direct_chunks = {node.text for node in direct_nodes}
+    pooled_chunks = {node.text for node in pooled_nodes}
+    print(f"chunk agreement (Jaccard): {len(direct_chunks & pooled_chunks) / len(direct_chunks | pooled_chunks):.3f}")
+
+    pooled_embeddings = np.asarray([node.embedding for node in pooled_nodes], dtype=np.float32)
+    direct_embeddings = np.asarray(embed_model.get_text_embedding_batch([node.text for node in pooled_nodes]), dtype=np.float32)
+    cosines = np.einsum('ij,ij->i', pooled_embeddings, direct_embeddings) / (
+        np.linalg.norm(pooled_embeddings, axis=1) * np.linalg.norm(direct_embeddings, axis=1)
+    )
+    bits = (binary_quantized(pooled_embeddings) == binary_quantized(direct_embeddings)).mean(axis=1)
+    print(f"cosine pooled vs direct: mean {cosines.mean():.4f}, min {cosines.min():.4f}")
+    print(f"binary bit agreement: mean {bits.mean():.4f}, min {bits.min():.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the SemanticSplitterNodeParser internals on long documents.
+
+Compares the paragraph group construction and the distance computation of the splitter with the
+previous implementation (string += per group, embed_model.similarity per pair of Python lists).
+Embeddings are random so only the splitter work is measured, not the model (which is not even loaded).
+Both implementations must return the same groups and distances.
+
+Usage:
+    python test-scripts/semantic_splitter_benchmark.py --paragraphs 1000 10000 50000 --buffer-size 1
+"""
+import sys
+import os
+
+SYSTEM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SYSTEM_PATH)
+
+import argparse
+import time
+import numpy as np
+from backend import NomicEmbed
+from backend.semantice_chunker.paragraph_semantic_splitter import SemanticSplitterNodeParser
+
+def legacy_groups(text_splits: list, buffer_size: int) -> list:
+    combined = []
+    for i in range(len(text_splits)):
+        combined_paragraph = ""
+        for j in range(i - buffer_size, i):
+            if j >= 0:
+                combined_paragraph += text_splits[j]
+        combined_paragraph += text_splits[i]
+        for j in range(i + 1, i + 1 + buffer_size):
+            if j < len(text_splits):
+                combined_paragraph += text_splits[j]
+        combined.append(combined_paragraph)
+    return combined
+
+def legacy_distances(embed_model, embeddings: list) -> list:
+    return [1 - embed_model.similarity(embeddings[i], embeddings[i + 1]) for i in range(len(embeddings) - 1)]
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--buffer-size', type=int, default=1)
+    parser.add_argument('--dim', type=int, default=768)
+    args = parser.parse_args()
+
+    embed_model = NomicEmbed()
+    splitter = SemanticSplitterNodeParser.from_defaults(embed_model=embed_model, buffer_size=args.buffer_size)
+    rng = np.random.default_rng(0)
+    for n_paragraphs in args.paragraphs:
+        # Subtitle-like lines of 40 to 400 characters
+        text_splits = [
+            "".join(rng.choice(list("abcdefghij klmnopqrst uvwxyz"), size=rng.integers(40, 400)))
+            for _ in range(n_paragraphs)
+        ]
+        embeddings = rng.standard_normal((n_paragraphs, args.dim)).astype(np.float32)
+        embedding_lists = embeddings.tolist()
+
+        old_groups, old_group_time = timed(legacy_groups, text_splits, args.buffer_size)
+        new_groups, new_group_time = timed(splitter._build_paragraph_groups, text_splits)
+        assert old_groups == [group["combined_paragraph"] for group in new_groups]
+
+        old_distances, old_distance_time = timed(legacy_distances, embed_model, embedding_lists)
+        new_distances, new_distance_time = timed(splitter._calculate_distances_between_paragraph_groups, embeddings)
+        assert np.allclose(old_distances, new_distances, atol=1e-5)
+
+        print(
+            f"{n_paragraphs:6d} paragraphs | groups {old_group_time * 1000:8.1f} -> {new_group_time * 1000:7.1f} ms "
+            f"| distances {old_distance_time * 1000:8.1f} -> {new_distance_time * 1000:7.1f} ms "
+            f"({old_distance_time / new_distance_time:.0f}x)"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Idle load test of the /api/process-query websocket.
+
+Opens an increasing number of websocket connections that never send a query and samples
+the CPU usage and the resident memory of the API server process. With event-driven session
+delivery the idle CPU should stay flat as connections scale (the old polling sender pinned a core).
+Exits with status 1 if the idle CPU of a step goes over --max-cpu, or if the resident memory
+grows by more than --max-memory-growth MB over the server before any connection.
+
+Usage (server started separately, e.g. `fastapi run main.py`):
+    python test-scripts/websocket_idle_load.py --pid <server pid> --connections 10 100 300 --max-cpu 5
+"""
+import argparse
+import asyncio
+import sys
+import time
+import psutil
+import websockets
+
+MB = 1024 * 1024
+
+async def measure(url: str, process: psutil.Process, n_connections: int, duration: float) -> tuple:
+    connections = []
+    for _ in range(n_connections):
+        connections.append(await websockets.connect(url))
+    await asyncio.sleep(1) # Let the server settle after the handshakes
+    process.cpu_percent(None)
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    elapsed = time.perf_counter() - start
+    cpu = process.cpu_percent(None)
+    rss = process.memory_info().rss
+    await asyncio.gather(*(connection.close() for connection in connections))
+    print(f"{n_connections:5d} idle connections: {cpu:6.1f}% CPU over {elapsed:.1f}s, {rss / MB:8.1f} MB resident")
+    return cpu, rss
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='ws://localhost:8000/api/process-query')
+    parser.add_argument('--pid', type=int, required=True, help='pid of the API server process')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 10, 100, 300])
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to sample at each step')
+    parser.add_argument('--max-cpu', type=float, default=10.0, help='highest idle CPU percent allowed at a step')
+    parser.add_argument('--max-memory-growth', type=float, default=100.0,
+                        help='highest growth of the resident memory allowed, in MB')
+    args = parser.parse_args()
+
+    process = psutil.Process(args.pid)
+    baseline_rss = process.memory_info().rss
+    print(f"server before connections: {baseline_rss / MB:.1f} MB resident")
+    failures = []
+    for n_connections in args.connections:
+        cpu, rss = await measure(args.url, process, n_connections, args.duration)
+        if cpu > args.max_cpu:
+            failures.append(f"{n_connections} idle connections use {cpu:.1f}% CPU (max {args.max_cpu:.1f}%)")
+        growth = (rss - baseline_rss) / MB
+        if growth > args.max_memory_growth:
+            failures.append(f"{n_connections} idle connections grow memory by {growth:.1f} MB (max {args.max_memory_growth:.1f} MB)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))